@@ -0,0 +1,124 @@
+import os
+import json
+import logging
+import threading
+
+class AnnotationJournal():
+    """Append-only log of the annotator edits made since the annotations were last loaded or saved.
+
+    One JSON object per line. The first line is the header, it names the file the edits apply to:
+
+        {"op": "header", "version": 1, "base": <annotations file>, "slides": <slides when started>}
+        {"op": "annotation_add", "slide": 3, "index": 0, "annotation": {...}}
+        {"op": "annotation_update", "slide": 3, "index": 0, "annotation": {...}}
+        ...
+
+    record() only queues the operation, a writer thread appends the queue to the file every
+    interval seconds, so the annotator never waits on the disk. Consecutive updates of the same
+    thing are merged before they are written. Saving the annotations starts a new journal, the
+    edits are then in annotations.json.
+    """
+    version = 1
+    # Operations where only the last one of a run needs to be replayed, with the fields naming their target
+    __mergedOperations = {"annotation_update": ("slide", "index"),
+                          "slide_text": ("slide",),
+                          "step_order": ()}
+
+    def __init__(self, path, interval=0.5):
+        self.path = path
+        self.interval = interval
+        self.__queue = []
+        # record() only takes the queue lock. The file lock is held from taking a batch off the
+        # queue until it is in the file, so the batches are written in order and start() can't
+        # truncate the file between the two
+        self.__queueLock = threading.Lock()
+        self.__fileLock = threading.Lock()
+        self.__stopEvent = threading.Event()
+        self.__thread = None
+
+    def start(self, header, keepOperations=False):
+        """Begin journaling the edits of header["base"], the operations already in the file are dropped unless keepOperations"""
+        with self.__fileLock:
+            self.__flushLocked()
+            with self.__queueLock:
+                self.__queue = []
+            if not keepOperations:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"op": "header", "version": AnnotationJournal.version, **header}, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__stopEvent.clear()
+            self.__thread = threading.Thread(target=self.__run, name="TutorialMakerJournal", daemon=True)
+            self.__thread.start()
+
+    def record(self, op, **fields):
+        with self.__queueLock:
+            self.__queue.append({"op": op, **fields})
+
+    def flush(self):
+        with self.__fileLock:
+            self.__flushLocked()
+
+    def close(self):
+        """Stop the writer thread and write the queued operations, start() starts it again"""
+        self.__stopEvent.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.flush()
+
+    def read(self):
+        """[header, operations] of the journal file, header is None if there is no usable journal.
+        A line cut by a crash ends the operations."""
+        if not os.path.exists(self.path):
+            return [None, []]
+        header = None
+        operations = []
+        with self.__fileLock:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        operation = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if header is None:
+                        if operation.get("op") != "header" or operation.get("version") != AnnotationJournal.version:
+                            return [None, []]
+                        header = operation
+                        continue
+                    operations.append(operation)
+        return [header, operations]
+
+    @staticmethod
+    def merge(operations):
+        """Drop the operations overwritten by the one right after them"""
+        merged = []
+        for operation in operations:
+            targetFields = AnnotationJournal.__mergedOperations.get(operation["op"])
+            if targetFields is not None and len(merged) > 0:
+                previous = merged[-1]
+                if previous["op"] == operation["op"] and all(previous.get(field) == operation.get(field) for field in targetFields):
+                    merged[-1] = operation
+                    continue
+            merged.append(operation)
+        return merged
+
+    def __flushLocked(self):
+        with self.__queueLock:
+            [operations, self.__queue] = [self.__queue, []]
+        if len(operations) == 0:
+            return
+        lines = [json.dumps(operation, ensure_ascii=False) + "\n" for operation in AnnotationJournal.merge(operations)]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __run(self):
+        while not self.__stopEvent.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logging.exception(f"Could not write the annotation journal {self.path}")
@@ -4,10 +4,14 @@ import qt
 import copy
 import math
 import json
+import weakref
+import functools
 from slicer.i18n import tr as _
 from enum import Flag, auto
-from Lib.TutorialUtils import Util
+from collections import OrderedDict
+from Lib.TutorialUtils import Util, get_output_path
 from Lib.TutorialUtils import Tutorial, TutorialScreenshot
+from Lib.WidgetMetadata import CompactWidgetMetadata
 
 class AnnotationType(Flag):
     Nil = auto() # Not for saving
@@ -36,6 +40,8 @@ class Annotation:
         self.optX = OptX
         self.optY = OptY
         self.text = Text
+        # Key of the text in the text dictionaries, set when loaded from an annotations file
+        self.textKey = None
         self.offsetX = OffsetX
         self.offsetY = OffsetY
         self.type = Type
@@ -90,6 +96,19 @@ class Annotation:
                            "text": self.text}
         return annotationJSON
 
+    def withText(self, text : str):
+        """Shallow copy drawing another text, the copies of one annotation can be drawn in parallel"""
+        localized = copy.copy(self)
+        localized.text = text
+        return localized
+
+    def StateKey(self):
+        """Everything changing how the annotation is drawn, a cached drawing is valid while the key is the same"""
+        return (id(self), self.type, self.text,
+                self.offsetX, self.offsetY, self.optX, self.optY,
+                self.color.rgba(), self.thickness, self.fontSize,
+                tuple(self.target["position"]), tuple(self.target["size"]), tuple(self.annotationOffset))
+
     def setOffset(self, Offset : list[int]):
         self.annotationOffset = Offset
         pass
@@ -387,11 +406,134 @@ class Annotation:
             painter.drawRect(rectToDraw)
 
 
+class WidgetSpatialIndex:
+    """Uniform grid over the widget rectangles of a slide, for the hover and selection queries.
+
+    Every grid cell lists the widgets overlapping it, so a query only tests the widgets of one
+    cell. Widgets covering too many cells are kept in a separate list tested on every query.
+    """
+    def __init__(self, widgets : list[dict], cellSize : int = 64, maxCellsPerWidget : int = 1024):
+        self.cellSize = cellSize
+        self.widgets = widgets
+        self.cells = {}
+        self.largeWidgets = []
+        for order, widget in enumerate(widgets):
+            rectX, rectY = widget["position"]
+            rectWidth, rectHeight = widget["size"]
+            firstCellX, lastCellX = int(rectX // cellSize), int((rectX + rectWidth) // cellSize)
+            firstCellY, lastCellY = int(rectY // cellSize), int((rectY + rectHeight) // cellSize)
+            if (lastCellX - firstCellX + 1)*(lastCellY - firstCellY + 1) > maxCellsPerWidget:
+                self.largeWidgets.append(order)
+                continue
+            for cellX in range(firstCellX, lastCellX + 1):
+                for cellY in range(firstCellY, lastCellY + 1):
+                    self.cells.setdefault((cellX, cellY), []).append(order)
+
+    def query(self, posX, posY) -> list[dict]:
+        """Widgets containing the point, the biggest first, ties keep the metadata order"""
+        cell = self.cells.get((int(posX // self.cellSize), int(posY // self.cellSize)), [])
+        hits = []
+        for order in self.largeWidgets + cell:
+            rectX, rectY = self.widgets[order]["position"]
+            rectWidth, rectHeight = self.widgets[order]["size"]
+            if rectX <= posX <= rectX + rectWidth and rectY <= posY <= rectY + rectHeight:
+                hits.append(order)
+        hits.sort(key= lambda order: (-self.widgets[order]["size"][0]*self.widgets[order]["size"][1], order))
+        return [self.widgets[order] for order in hits]
+
+class SlideImageCache:
+    """Process wide LRU of the lazily loaded slides currently holding their full resolution images.
+
+    A slide created with an ImageLoader decodes its image on first use and registers here, once
+    the images held go over the budget the least recently used slides release theirs. The budget
+    is read from the TutorialMaker/AnnotatorImageBudgetMB setting.
+
+    The slides are only weakly referenced, a slide dropped with its tutorial leaves the cache. The
+    annotators clear() it when a tutorial is opened or closed.
+    """
+    defaultBudgetMB = 1024
+    __entries = OrderedDict()
+    __size = 0
+    __budget = None
+
+    @staticmethod
+    def budget():
+        if SlideImageCache.__budget is None:
+            budgetMB = slicer.app.userSettings().value("TutorialMaker/AnnotatorImageBudgetMB", SlideImageCache.defaultBudgetMB)
+            SlideImageCache.__budget = int(budgetMB) * 1024 * 1024
+        return SlideImageCache.__budget
+
+    @staticmethod
+    def touch(slide):
+        entries = SlideImageCache.__entries
+        key = id(slide)
+        entry = entries.get(key)
+        if entry is not None and entry[0]() is slide:
+            entries.move_to_end(key)
+            return
+        if entry is not None:
+            # The id of a collected slide, given again to a new one
+            SlideImageCache.__remove(key, entry[0])
+        width, height = slide.ImageSize()
+        # The background, the committed annotations layer and the annotated copy, 4 bytes per pixel each
+        entries[key] = [weakref.ref(slide, functools.partial(SlideImageCache.__remove, key)), 3*4*width*height]
+        SlideImageCache.__size += entries[key][1]
+        # The slide just loaded is always kept, even alone over the budget
+        while SlideImageCache.__size > SlideImageCache.budget() and len(entries) > 1:
+            [evictedKey, [evictedRef, size]] = entries.popitem(last=False)
+            SlideImageCache.__size -= size
+            evicted = evictedRef()
+            if evicted is not None:
+                evicted.ReleaseImage()
+
+    @staticmethod
+    def discard(slide):
+        entry = SlideImageCache.__entries.get(id(slide))
+        if entry is not None and entry[0]() is slide:
+            SlideImageCache.__remove(id(slide), entry[0])
+
+    @staticmethod
+    def clear():
+        entries = list(SlideImageCache.__entries.values())
+        SlideImageCache.__entries.clear()
+        SlideImageCache.__size = 0
+        for [slideRef, size] in entries:
+            slide = slideRef()
+            if slide is not None:
+                slide.ReleaseImage()
+
+    @staticmethod
+    def __remove(key, slideRef):
+        # Also the callback of the weak references, only the entry of that reference is removed
+        entry = SlideImageCache.__entries.get(key)
+        if entry is not None and entry[0] is slideRef:
+            del SlideImageCache.__entries[key]
+            SlideImageCache.__size -= entry[1]
+
 class AnnotatorSlide:
-    def __init__(self, BackgroundImage : qt.QPixmap, Metadata : dict, Annotations : list[Annotation] = None, WindowOffset : list[int] = None):
+    def __init__(self, BackgroundImage : qt.QPixmap, Metadata : dict, Annotations : list[Annotation] = None, WindowOffset : list[int] = None,
+                 ImageLoader = None, ImageSize : list[int] = None):
 
+        # Incremented every time outputImage is drawn again, the scaled copies are only valid for one revision
+        self.revision = 0
+        self.__resizedCache = {}
+        self.__pyramid = [-1, []]
+
+        # Incremented every time the background image is replaced, see SaveImage
+        self.imageRevision = 0
+        self.__savedImage = None
+
+        # outputImage is only drawn again when the slide is dirty, see MarkDirty
+        self.__dirty = True
         self.image = BackgroundImage
-        self.outputImage = self.image.copy()
+        # With an ImageLoader the background is decoded on first use and may be released again by
+        # SlideImageCache, ImageSize avoids loading it only to lay out the thumbnails. The loader
+        # returns a QImage and must be safe to call from a worker thread, see DecodeImage
+        self.__imageLoader = ImageLoader
+        self.__imageSize = ImageSize
+        self.outputImage = None
+        if BackgroundImage is not None:
+            self.outputImage = self.image.copy()
         self.metadata = Metadata
         if Annotations is None:
             Annotations = []
@@ -404,14 +546,102 @@ class AnnotatorSlide:
         self.SlideLayout = "Screenshot"
         self.SlideTitle = ""
         self.SlideBody = ""
+        # Keys of the title and body in the text dictionaries, set when loaded from an annotations file
+        self.SlideTitleKey = ""
+        self.SlideBodyKey = ""
         
         self.devicePixelRatio = 1.0
         self.screenshotPaths : list[str] = []
+        self.__widgetIndex = None
+        self.__widgetsByPath = None
         pass
 
+    @property
+    def image(self) -> qt.QPixmap:
+        if self.__imageLoader is not None:
+            if self.__image is None:
+                self.__image = qt.QPixmap.fromImage(self.__imageLoader())
+            SlideImageCache.touch(self)
+        return self.__image
+
+    @image.setter
+    def image(self, image : qt.QPixmap):
+        # An image set explicitly replaces the loader, the slide keeps it until replaced again
+        self.__imageLoader = None
+        self.__imageSize = None
+        SlideImageCache.discard(self)
+        self.__image = image
+        self.__committedLayer = None
+        self.imageRevision += 1
+        self.MarkDirty()
+
+    def ImageSize(self) -> list[int]:
+        """Size of the background image, without loading it when the size is already known"""
+        if self.__image is not None:
+            return [self.__image.width(), self.__image.height()]
+        if self.__imageSize is not None and self.__imageSize[0] > 0 and self.__imageSize[1] > 0:
+            return list(self.__imageSize)
+        image = self.image
+        return [image.width(), image.height()]
+
+    def IsImageLoaded(self) -> bool:
+        return self.__imageLoader is None or self.__image is not None
+
+    def DecodeImage(self) -> qt.QImage:
+        """Background as a new QImage, without keeping it. Can be called from a worker thread
+        (e.g. through a BackgroundLoader) for lazily loaded slides, then given back with ProvideImage"""
+        if self.__imageLoader is not None:
+            return self.__imageLoader()
+        return self.__image.toImage()
+
+    def ProvideImage(self, image : qt.QImage):
+        if self.__imageLoader is None or self.__image is not None:
+            return
+        self.__image = qt.QPixmap.fromImage(image)
+        SlideImageCache.touch(self)
+
+    def SaveImage(self, path):
+        """Write the background image as PNG, skipped when this revision is already the file at path"""
+        if self.__savedImage is not None and self.__savedImage[0] == path and self.__savedImage[1] == self.imageRevision:
+            # The file may have been overwritten by another slide saved at the same path since
+            try:
+                stat = os.stat(path)
+                if self.__savedImage[2] == (stat.st_mtime_ns, stat.st_size):
+                    return
+            except OSError:
+                pass
+        image = self.image
+        def writeFile(tempPath):
+            if not image.save(tempPath, "PNG"):
+                raise OSError(f"Could not write {path}")
+        Util.writeFileAtomic(path, writeFile)
+        stat = os.stat(path)
+        self.__savedImage = [path, self.imageRevision, (stat.st_mtime_ns, stat.st_size)]
+
+    def ReleaseImage(self):
+        """Drop the full resolution images of a lazily loaded slide, they are loaded again on next use.
+        The scaled copies already made stay valid, the slide is only drawn again when shown at a new size."""
+        if self.__imageLoader is None or self.__image is None:
+            return
+        self.__imageSize = [self.__image.width(), self.__image.height()]
+        self.__image = None
+        self.__committedLayer = None
+        self.outputImage = None
+        self.__pyramid = [-1, []]
+        SlideImageCache.discard(self)
+
+    def MarkDirty(self):
+        """Call after changing anything drawn on the slide, outputImage is drawn again on next use"""
+        self.__dirty = True
+
+    def NeedsRedraw(self) -> bool:
+        # The selection bounding box is animated, it's the only reason to draw a clean slide again
+        return self.__dirty or any(annotation.drawBoundingBox for annotation in self.annotations)
+
     def AddAnnotation(self, annotation : Annotation):
         annotation.setOffset(self.windowOffset)
         self.annotations.append(annotation)
+        self.MarkDirty()
         pass
 
     def FindWidgetsAtPos(self, posX, posY):
@@ -420,13 +650,30 @@ class AnnotatorSlide:
         posX += self.windowOffset[0]
         posY += self.windowOffset[1]
 
-        for widget in self.metadata:
-            rectX, rectY = widget["position"]
-            rectWidth, rectHeight = widget["size"]
-            if rectX <= posX <= rectX + rectWidth and rectY <= posY <= rectY + rectHeight:
-                results.append(widget)
+        if not isinstance(self.metadata, list):
+            return results
+        # Built on the first query, and again only if the metadata of the slide is replaced
+        if self.__widgetIndex is None or self.__widgetIndex.widgets is not self.metadata or len(self.__widgetIndex.widgets) != self.__widgetIndexSize:
+            self.__widgetIndex = WidgetSpatialIndex(self.metadata)
+            self.__widgetIndexSize = len(self.metadata)
+        results = self.__widgetIndex.query(posX, posY)
         return results
 
+    def FindWidgetByPath(self, path):
+        if not isinstance(self.metadata, list):
+            return None
+        # Built on the first query, and again only if the metadata of the slide is replaced
+        if self.__widgetsByPath is None or self.__widgetsByPath[0] is not self.metadata or self.__widgetsByPath[1] != len(self.metadata):
+            self.__widgetsByPath = [self.metadata, len(self.metadata), AnnotatorSlide.IndexWidgetsByPath(self.metadata)]
+        return self.__widgetsByPath[2].get(path)
+
+    @staticmethod
+    def IndexWidgetsByPath(metadata) -> dict:
+        """Widgets of a slide metadata by path, when a path is repeated the last widget is kept"""
+        if not isinstance(metadata, list):
+            return {}
+        return {widget["path"]: widget for widget in metadata}
+
     def FindAnnotationsAtPos(self, posX, posY):
         results = []
 
@@ -441,8 +688,7 @@ class AnnotatorSlide:
 
 
     def MapScreenToImage(self, qPos : qt.QPoint, qLabel : qt.QLabel):
-        imageSizeX = self.image.width()
-        imageSizeY = self.image.height()
+        imageSizeX, imageSizeY = self.ImageSize()
 
         labelWidth = qLabel.width
         labelHeight = qLabel.height
@@ -453,8 +699,7 @@ class AnnotatorSlide:
         return [x,y]
 
     def MapImageToScreen(self, qPos : qt.QPoint, qLabel : qt.QLabel):
-        imageSizeX = self.image.width()
-        imageSizeY = self.image.height()
+        imageSizeX, imageSizeY = self.ImageSize()
 
         labelWidth = qLabel.width
         labelHeight = qLabel.height
@@ -465,31 +710,87 @@ class AnnotatorSlide:
         return [x,y]
 
     def GetResized(self, resizeX : float = 0, resizeY : float = 0, keepAspectRatio=False) -> qt.QPixmap:
+        # keepAspectRatio is kept for compatibility, the result was always scaled ignoring the aspect
+        # ratio as the label sizes and MapScreenToImage rely on it
+        key = (int(resizeX), int(resizeY))
+        cached = self.__resizedCache.get(key)
+        if not self.__dirty and cached is not None and cached[0] == self.revision:
+            return cached[1]
+        if self.__dirty or self.outputImage is None:
+            self.ReDraw()
         if resizeX <= 0 or resizeY <= 0:
             return self.outputImage
-        if keepAspectRatio:
-            self.outputImage.scaled(resizeX, resizeY, qt.Qt.KeepAspectRatio, qt.Qt.SmoothTransformation)
-        return self.outputImage.scaled(resizeX, resizeY,qt.Qt.IgnoreAspectRatio, qt.Qt.SmoothTransformation)
+        resized = self.__GetPyramidLevel(resizeX, resizeY).scaled(resizeX, resizeY, qt.Qt.IgnoreAspectRatio, qt.Qt.SmoothTransformation)
+        # Few sizes are used at once (thumbnail and preview), the oldest ones are dropped
+        self.__resizedCache.pop(key, None)
+        self.__resizedCache[key] = (self.revision, resized)
+        while len(self.__resizedCache) > 4:
+            del self.__resizedCache[next(iter(self.__resizedCache))]
+        return resized
+
+    def __GetPyramidLevel(self, resizeX : float, resizeY : float) -> qt.QPixmap:
+        """Smallest pre-scaled copy (half size per level) of outputImage still bigger than the target"""
+        if self.__pyramid[0] != self.revision:
+            # The first size asked for a revision is scaled from the full image, the levels are only
+            # worth building when the same revision is scaled again (resize, thumbnails)
+            self.__pyramid = [self.revision, []]
+            return self.outputImage
+        levels = self.__pyramid[1]
+        level = self.outputImage
+        levelIndex = 0
+        while level.width()//2 >= resizeX and level.height()//2 >= resizeY and level.width() >= 512:
+            if levelIndex == len(levels):
+                levels.append(level.scaled(level.width()//2, level.height()//2, qt.Qt.IgnoreAspectRatio, qt.Qt.SmoothTransformation))
+            level = levels[levelIndex]
+            levelIndex += 1
+        return level
 
     def ReDraw(self):
+        # The committed annotations are drawn over the background once and cached, only the
+        # selected or in progress annotations are drawn again over a copy of that layer
+        committed = []
+        transient = []
+        for annotation in self.annotations:
+            if annotation.PERSISTENT and not annotation.drawBoundingBox:
+                committed.append(annotation)
+            else:
+                transient.append(annotation)
+
+        signature = tuple(annotation.StateKey() for annotation in committed)
+        if self.__committedLayer is None or self.__committedLayer[0] != signature:
+            layer = self.image.copy()
+            AnnotatorSlide.DrawAnnotations(layer, committed)
+            self.__committedLayer = [signature, layer]
+
         del self.outputImage
-        self.outputImage = self.image.copy()
-        self.Draw()
+        # Shares the layer data, it's only copied when the transient annotations are drawn on it
+        self.outputImage = qt.QPixmap(self.__committedLayer[1])
+        AnnotatorSlide.DrawAnnotations(self.outputImage, transient)
+        self.revision += 1
+        self.__dirty = False
 
     def Draw(self):
-        painter = qt.QPainter(self.outputImage)
+        AnnotatorSlide.DrawAnnotations(self.outputImage, self.annotations)
+
+    @staticmethod
+    def DrawAnnotations(paintDevice, annotations : list[Annotation]):
+        if len(annotations) == 0:
+            return
+        painter = qt.QPainter(paintDevice)
         painter.setRenderHint(qt.QPainter.Antialiasing, True)
         pen = qt.QPen()
         brush = qt.QBrush()
-        for annotation in self.annotations:
+        for annotation in annotations:
             annotation.draw(painter, pen, brush)
         painter.end()
 
 class AnnotatedTutorial:
     
     @staticmethod
-    def GetLocalizedDict(lang, tutorialName = ""):
-        dictPath = f"{os.path.dirname(__file__)}/../Outputs" + "/Annotations/text_dict_default.json"
+    def GetLocalizedDict(lang, tutorialName = "", inputFolder = None):
+        if inputFolder is None:
+            inputFolder = get_output_path()
+        dictPath = inputFolder + "/Annotations/text_dict_default.json"
         textDict = {}
         with open(dictPath, encoding='utf-8') as file:
                 textDict = json.load(file)
@@ -497,14 +798,24 @@ class AnnotatedTutorial:
 
     @staticmethod
     def GetCompositeSlide(tutorialScreenshots : list[TutorialScreenshot]):
-        finalImage = tutorialScreenshots[0].getImage().toImage()
-        finalJson = copy.deepcopy(tutorialScreenshots[0].getWidgets())
+        return [qt.QPixmap.fromImage(AnnotatedTutorial.LoadCompositeImage(tutorialScreenshots)), AnnotatedTutorial.GetCompositeMetadata(tutorialScreenshots)]
+
+    @staticmethod
+    def GetCompositeMetadata(tutorialScreenshots : list[TutorialScreenshot]):
+        # getWidgets returns new dicts every call, no need to copy them
+        finalJson = []
+        for slide in tutorialScreenshots:
+            finalJson.extend(slide.getWidgets())
+        return finalJson
+
+    @staticmethod
+    def LoadCompositeImage(tutorialScreenshots : list[TutorialScreenshot]):
+        # Only QImage is used, this also runs on the annotator loading threads
+        finalImage = tutorialScreenshots[0].loadImage()
         painter = qt.QPainter(finalImage)
         for slide in tutorialScreenshots[1:]:
 
-            finalJson.extend(copy.deepcopy(slide.getWidgets()))
-
-            nextImage = slide.getImage().toImage()
+            nextImage = slide.loadImage()
 
             mainWidget = slide.getWidgets()[0]
             painter.drawImage(qt.QRect(mainWidget["position"][0],
@@ -513,17 +824,18 @@ class AnnotatedTutorial:
                                        nextImage.height()),
                                        nextImage)
         painter.end()
-        return [qt.QPixmap().fromImage(finalImage), finalJson]
+        return finalImage
     
     @staticmethod
-    def LoadAnnotatedTutorial(path):
+    def LoadAnnotatedTutorial(path, inputFolder = None):
+        """inputFolder holds the Raw/ captures and Annotations/ of the tutorial, the Outputs folder by default"""
         with open(path, encoding='utf-8') as file:
             rawData = json.load(file)
 
         if not ("TutorialMaker_version" in rawData):
-            return AnnotatedTutorial.LoadAnnotatedTutorial_Legacy(path)
+            return AnnotatedTutorial.LoadAnnotatedTutorial_Legacy(path, inputFolder)
 
-        outputFolder = f"{os.path.dirname(__file__)}/../Outputs"
+        outputFolder = get_output_path()
 
         settings = slicer.app.userSettings()
         currentLanguage = settings.value("language")
@@ -617,7 +929,7 @@ class AnnotatedTutorial:
     @staticmethod
     def SaveAnnotatedTutorial(tutorialInfo, slides : list[AnnotatorSlide]):
         import re
-        outputFolder = f"{os.path.dirname(__file__)}/../Outputs"
+        outputFolder = get_output_path()
 
         outputFileAnnotations = {**tutorialInfo}
         outputFileTextDict = {}
@@ -629,8 +941,6 @@ class AnnotatedTutorial:
             layoutName = getattr(slide, "SlideLayout", "")
             if (not slide.Active) and layoutName not in ("CoverPage", "Acknowledgment"):
                 continue
-            slideImage = slide.image
-
             cleanSlideTitle = slide.SlideTitle.replace(' ', '')
             cleanSlideTitle = re.sub(r'[^a-zA-Z0-9]', '', cleanSlideTitle)
 
@@ -641,10 +951,11 @@ class AnnotatedTutorial:
                 slideTitle += "slide"
                 slideImagePath += "slide"
 
-            slideImage.save(slideImagePath + ".png", "PNG")
+            slide.SaveImage(slideImagePath + ".png")
 
-            textDict = {f"{slideTitle}_title": slide.SlideTitle,
-                        f"{slideTitle}_body": slide.SlideBody}
+            # One dictionary for the whole tutorial, filled in place
+            outputFileTextDict[f"{slideTitle}_title"] = slide.SlideTitle
+            outputFileTextDict[f"{slideTitle}_body"] = slide.SlideBody
 
             slideInfo = {"ImagePath": f"{slideTitle}.png",
                          "SlideCode": slide.screenshotPaths,
@@ -655,7 +966,7 @@ class AnnotatedTutorial:
 
             for annIndex, annotation in enumerate(slide.annotations):
                 info = annotation.toDict()
-                textDict[f"{slidePrefix}_{info['type']}_{annIndex}"] = info["text"]
+                outputFileTextDict[f"{slidePrefix}_{info['type']}_{annIndex}"] = info["text"]
                 slideInfo["Annotations"].append({"widgetPath": info["widgetPath"],
                                                  "type": info["type"],
                                                  "offset": info["offset"],
@@ -665,17 +976,13 @@ class AnnotatedTutorial:
                                                   "text": f"{slidePrefix}_{info['type']}_{annIndex}"})
                 pass
             outputFileAnnotations["slides"].append(slideInfo)
-            outputFileTextDict = {**outputFileTextDict, **textDict}
 
-        with open(file= f"{outputFolder}/annotations.json", mode='w', encoding="utf-8") as fd:
-            json.dump(outputFileAnnotations, fd, ensure_ascii=False, indent=4)
-
-        with open(file= f"{outputFolder}/text_dict_default.json", mode='w', encoding="utf-8") as fd:
-            json.dump(outputFileTextDict, fd, ensure_ascii=False, indent=4)
+        Util.writeJSONAtomic(outputFileAnnotations, f"{outputFolder}/annotations.json")
+        Util.writeJSONAtomic(outputFileTextDict, f"{outputFolder}/text_dict_default.json")
 
     @staticmethod
-    def LoadAnnotatedTutorial_Legacy(path):
-        outputFolder = f"{os.path.dirname(__file__)}/../Outputs"
+    def LoadAnnotatedTutorial_Legacy(path, inputFolder = None):
+        outputFolder = inputFolder if inputFolder is not None else get_output_path()
 
         settings = slicer.app.userSettings()
         currentLanguage = settings.value("language")
@@ -683,7 +990,7 @@ class AnnotatedTutorial:
         imagePaths : list[str] = [] #TODO: Improve this part
         slides = []
 
-        textDict = AnnotatedTutorial.GetLocalizedDict(currentLanguage)
+        textDict = AnnotatedTutorial.GetLocalizedDict(currentLanguage, inputFolder=outputFolder)
         with open(path, encoding='utf-8') as file:
             rawData = json.load(file)
         TutorialInfo = {
@@ -714,7 +1021,7 @@ class AnnotatedTutorial:
                     slideMetadata = []
                     test_contents = os.listdir(stepPath)
                     for content in test_contents:
-                        if(".json" not in content):
+                        if(".json" not in content and CompactWidgetMetadata.extension not in content):
                             continue
                         tsParser.metadata = f"{stepPath}/{content}"
                         slideMetadata.extend(tsParser.getWidgets())
@@ -728,14 +1035,14 @@ class AnnotatedTutorial:
                 slideImage = qt.QImage(f"{outputFolder}/Annotations/{slideData['ImagePath']}")
 
             annotations = []
+            widgetsByPath = AnnotatorSlide.IndexWidgetsByPath(slideMetadata)
             for annotationData in slideData["Annotations"]:
-                targetWidget = {
-                    "position": [0,0],
-                    "size": [1,1]
-                }
-                for widget in slideMetadata:
-                    if annotationData["widgetPath"] == widget["path"]:
-                        targetWidget = widget
+                targetWidget = widgetsByPath.get(annotationData["widgetPath"])
+                if targetWidget is None:
+                    targetWidget = {
+                        "position": [0,0],
+                        "size": [1,1]
+                    }
                 annotation = Annotation(
                     targetWidget,
                     *annotationData["offset"],
@@ -748,6 +1055,7 @@ class AnnotatedTutorial:
                     annotationData["penSettings"]["fontSize"],
                     annotationData["penSettings"]["thickness"]
                 )
+                annotation.textKey = annotationData["text"]
                 annotation.PERSISTENT = True
                 annotations.append(annotation)
             
@@ -762,6 +1070,8 @@ class AnnotatedTutorial:
             annotatedSlide.devicePixelRatio = 1.0
             annotatedSlide.SlideTitle = textDict.get(slideData["SlideTitle"], "")
             annotatedSlide.SlideBody = textDict.get(slideData["SlideDesc"], "")
+            annotatedSlide.SlideTitleKey = slideData["SlideTitle"]
+            annotatedSlide.SlideBodyKey = slideData["SlideDesc"]
             annotatedSlide.SlideLayout = slideData["SlideLayout"]
 
             imagePaths.append(slideData["ImagePath"])
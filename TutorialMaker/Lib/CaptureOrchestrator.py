@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+@dataclass
+class CaptureJob:
+    tutorial: str
+    language: str
+    resolution: str = "1920x1080"
+    fontSize: int = 14
+    result: dict = field(default_factory=dict)
+
+    def name(self):
+        return f"{self.tutorial}/{self.language}/{self.resolution}"
+
+class CaptureOrchestrator():
+    """Captures the tutorial x language x resolution matrix on a pool of Slicer processes.
+
+    Every job runs Scripts/capture_worker.py in its own Slicer on the offscreen Qt platform, with
+    TUTORIALMAKER_OUTPUT_DIR pointing to a folder of the job, <output>/<tutorial>/<language>/<resolution>,
+    and TUTORIALMAKER_NON_INTERACTIVE set so the capture takes the default of its dialogs.
+    The workers share nothing, so the capture scales with the cores. The results and failures of
+    all the jobs are gathered in <output>/capture_report.json.
+
+    It does not need Slicer itself and can be run from any Python:
+
+        python TutorialMaker/Lib/CaptureOrchestrator.py --slicer /path/to/Slicer --languages en fr es pt_BR
+    """
+    def __init__(self, slicerExecutable, outputFolder, maxWorkers=None, timeout=3600, qtPlatform="offscreen"):
+        self.slicerExecutable = slicerExecutable
+        self.outputFolder = os.path.abspath(outputFolder)
+        if maxWorkers is None:
+            # A capturing Slicer keeps about two cores busy (GUI and rendering)
+            maxWorkers = max(1, (os.cpu_count() or 2) // 2)
+        self.maxWorkers = maxWorkers
+        self.timeout = timeout
+        self.qtPlatform = qtPlatform
+        self.modulePath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.workerScript = f"{self.modulePath}/Scripts/capture_worker.py"
+
+    def availableTutorials(self):
+        testingFolder = f"{self.modulePath}/Testing"
+        return sorted(content[:-3] for content in os.listdir(testingFolder) if content.endswith(".py"))
+
+    @staticmethod
+    def createJobs(tutorials, languages, resolutions, fontSize=14):
+        return [CaptureJob(tutorial, language, resolution, fontSize)
+                for tutorial in tutorials for language in languages for resolution in resolutions]
+
+    def jobFolder(self, job):
+        return os.path.join(self.outputFolder, job.tutorial, job.language, job.resolution)
+
+    def run(self, jobs):
+        """Run the jobs, returns the report also written to capture_report.json"""
+        os.makedirs(self.outputFolder, exist_ok=True)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            results = list(executor.map(self.runJob, jobs))
+
+        report = {"slicer": self.slicerExecutable,
+                  "workers": self.maxWorkers,
+                  "elapsed": round(time.perf_counter() - start, 3),
+                  "jobs": len(results),
+                  "failed": len([result for result in results if result["status"] != "ok"]),
+                  "results": results}
+        with open(os.path.join(self.outputFolder, "capture_report.json"), "w", encoding="utf-8") as fd:
+            json.dump(report, fd, ensure_ascii=False, indent=4)
+        return report
+
+    def runJob(self, job):
+        jobFolder = self.jobFolder(job)
+        os.makedirs(jobFolder, exist_ok=True)
+        resultPath = os.path.join(jobFolder, "capture_result.json")
+        logPath = os.path.join(jobFolder, "capture.log")
+        if os.path.exists(resultPath):
+            os.remove(resultPath)
+
+        env = dict(os.environ)
+        env["TUTORIALMAKER_OUTPUT_DIR"] = jobFolder
+        # The workers never show a dialog, nobody could close it
+        env["TUTORIALMAKER_NON_INTERACTIVE"] = "1"
+        if self.qtPlatform:
+            env["QT_QPA_PLATFORM"] = self.qtPlatform
+        command = [self.slicerExecutable, "--no-splash",
+                   "--additional-module-paths", self.modulePath,
+                   "--python-script", self.workerScript,
+                   "--tutorial", job.tutorial,
+                   "--language", job.language,
+                   "--resolution", job.resolution,
+                   "--font-size", str(job.fontSize),
+                   "--result", resultPath]
+
+        result = {"tutorial": job.tutorial, "language": job.language, "resolution": job.resolution,
+                  "output": jobFolder, "log": logPath}
+        start = time.perf_counter()
+        with open(logPath, "w", encoding="utf-8") as log:
+            try:
+                process = subprocess.run(command, env=env, stdout=log, stderr=subprocess.STDOUT, timeout=self.timeout)
+                result["returncode"] = process.returncode
+            except subprocess.TimeoutExpired:
+                result["returncode"] = None
+                result["status"] = "timeout"
+                result["error"] = f"No result after {self.timeout}s"
+            except OSError as e:
+                result["returncode"] = None
+                result["status"] = "failed"
+                result["error"] = f"Could not start Slicer: {e}"
+        result["elapsed"] = round(time.perf_counter() - start, 3)
+
+        if "status" not in result:
+            if os.path.exists(resultPath):
+                with open(resultPath, encoding="utf-8") as fd:
+                    workerResult = json.load(fd)
+                result["status"] = workerResult.get("status", "failed")
+                result["screenshots"] = workerResult.get("screenshots", 0)
+                if "error" in workerResult:
+                    result["error"] = workerResult["error"]
+            else:
+                result["status"] = "failed"
+                result["error"] = f"Slicer exited with {result['returncode']} without a result, see the log"
+        job.result = result
+        print(f"[{result['status'].upper()}] {job.name()} in {result['elapsed']:.0f}s", flush=True)
+        return result
+
+def main(argv):
+    moduleOutputs = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Outputs", "Captures")
+    parser = argparse.ArgumentParser(description="Capture tutorials in several languages and resolutions on parallel Slicer processes")
+    parser.add_argument("--slicer", required=True, help="Slicer executable")
+    parser.add_argument("--tutorials", nargs="+", default=None, help="Tutorials of the Testing folder (default: all)")
+    parser.add_argument("--languages", nargs="+", default=["en", "fr", "es", "pt_BR"])
+    parser.add_argument("--resolutions", nargs="+", default=["1920x1080"], help="Main window sizes, WIDTHxHEIGHT")
+    parser.add_argument("--font-size", type=int, default=14)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel Slicer processes (default: half the cores)")
+    parser.add_argument("--timeout", type=int, default=3600, help="Seconds before a capture is stopped")
+    parser.add_argument("--output", default=moduleOutputs, help="Folder receiving one folder per job and the report")
+    args = parser.parse_args(argv)
+
+    orchestrator = CaptureOrchestrator(args.slicer, args.output, args.workers, args.timeout)
+    tutorials = args.tutorials if args.tutorials is not None else orchestrator.availableTutorials()
+    report = orchestrator.run(CaptureOrchestrator.createJobs(tutorials, args.languages, args.resolutions, args.font_size))
+    print(f"{report['jobs'] - report['failed']}/{report['jobs']} captures succeeded in {report['elapsed']:.0f}s, "
+          f"report: {os.path.join(orchestrator.outputFolder, 'capture_report.json')}")
+    return 0 if report["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
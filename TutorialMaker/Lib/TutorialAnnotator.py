@@ -3,8 +3,9 @@ import qt
 import json
 import os
 import copy
-from Lib.Annotations import Annotation, AnnotationType, AnnotatorSlide, AnnotatedTutorial
-from Lib.TutorialUtils import Tutorial, TutorialScreenshot
+import functools
+from Lib.Annotations import Annotation, AnnotationType, AnnotatorSlide, AnnotatedTutorial, SlideImageCache
+from Lib.TutorialUtils import Tutorial, TutorialScreenshot, BackgroundLoader, get_output_path
 
 import slicer
 from slicer.i18n import tr as _
@@ -48,8 +49,19 @@ class TutorialAnnotator(qt.QMainWindow):
 
         # Need to do a overhaul of the preview function so this isn't necessary
         self.lastAppPos = qt.QPoint()
+
+        # Steps and screenshots are loaded on worker threads, see loadImagesAndMetadata
+        self.imageLoader = BackgroundLoader()
+        self.decodingSlides = set()
+        # Incremented by cancelLoading, the results of the loads submitted before are dropped
+        self.loadGeneration = 0
+        # Steps decoded while opening, about what fits in the slide list
+        self.prefetchedSteps = 8
+        self.loadingSteps = {}
+        self.nextLoadingStep = 0
+        self.loadingStepCount = 0
         
-        self.outputFolder = f"{os.path.dirname(__file__)}/../Outputs/Annotations"
+        self.outputFolder = f"{get_output_path()}/Annotations"
 
         # Tutorial Information
         self.tutorialInfo = {"name": "", "author" : "", "date": "", "desc": ""}
@@ -95,6 +107,11 @@ class TutorialAnnotator(qt.QMainWindow):
         self.slidesScrollArea.setAcceptDrops(True)
         self.slidesScrollArea.installEventFilter(self)
 
+        # Thumbnails are only drawn for the slides scrolled into view
+        slidesScrollBar = self.slidesScrollArea.verticalScrollBar()
+        slidesScrollBar.valueChanged.connect(lambda value: self.updateVisibleThumbnails())
+        slidesScrollBar.rangeChanged.connect(lambda minimum, maximum: self.updateVisibleThumbnails())
+
         # Offset positional helper
         self.OffsetHelperWidget = DraggableLabel()
         self.OffsetHelperWidget.setParent(self.selectedSlideWidget)
@@ -126,6 +143,13 @@ class TutorialAnnotator(qt.QMainWindow):
         self.icon_arrowUp = qt.QIcon(qt.QPixmap.fromImage(self.image_ArrowUp))
         self.icon_arrowDown = qt.QIcon(qt.QPixmap.fromImage(self.image_ArrowDown))
 
+        # Shown while the slides of a tutorial are being loaded
+        self.loadingProgress = qt.QProgressBar()
+        self.loadingProgress.setMaximumWidth(250)
+        self.loadingProgress.setFormat(_("Loading slides %v/%m"))
+        self.loadingProgress.hide()
+        self.statusBar().addPermanentWidget(self.loadingProgress)
+
         self.createToolbarActions()
         pass
 
@@ -246,6 +270,7 @@ class TutorialAnnotator(qt.QMainWindow):
     def updateSelectedAnnotationSettings(self):
         if self.selectedAnnotation is not None:
             self.selectedAnnotation.penConfig(self.penSettings["color"], self.penSettings["fontSize"],self.penSettings["penThickness"], brush=True)
+            self.selectedAnnotator.MarkDirty()
         pass
 
     def changeAnnotationType(self, annotationType):
@@ -281,6 +306,7 @@ class TutorialAnnotator(qt.QMainWindow):
 
         self.changeSelectedSlide(self.selectedSlideIndex + indexFixer)
         self.slide_gridLayout.removeWidget(deletedSlide)
+        deletedSlide.Slide.ReleaseImage()
         deletedSlide.deleteLater()
         pass
 
@@ -325,6 +351,7 @@ class TutorialAnnotator(qt.QMainWindow):
         self.slides[index] = tmp
         self.slides[index].slideIndex = index
         self.slide_gridLayout.addWidget(self.slides[index], index, 0)
+        qt.QTimer.singleShot(0, self.updateVisibleThumbnails)
         pass
 
     def changeSelectedSlide(self, slideId):
@@ -342,6 +369,7 @@ class TutorialAnnotator(qt.QMainWindow):
 
         self.selectedSlideWidget.setPixmap(selectedScreenshot.GetResized(*self.selectedSlideSize, keepAspectRatio=True))
         self.selectedAnnotator = selectedScreenshot
+        self.selectedAnnotator.MarkDirty()
 
         # Load text from slideAnnotator
         self.slideTitleWidget.setText(self.selectedAnnotator.SlideTitle)
@@ -353,6 +381,7 @@ class TutorialAnnotator(qt.QMainWindow):
             self.selectedAnnotation.drawBoundingBox = False
             if not self.selectedAnnotation.PERSISTENT:
                 self.selectedAnnotator.annotations.remove(self.selectedAnnotation)
+            self.selectedAnnotator.MarkDirty()
             self.selectedAnnotation = None
             if self.selectedAnnotationType == AnnotationType.Selected:
                 self.selectedAnnotationType = AnnotationType.Selecting
@@ -381,6 +410,7 @@ class TutorialAnnotator(qt.QMainWindow):
         self.selectedAnnotation = selectedAnnotation
         self.selectedAnnotationType = AnnotationType.Selected
         self.selectedAnnotation.drawBoundingBox = True
+        self.selectedAnnotator.MarkDirty()
 
     def annotationHandler(self, appPos):
         if self.selectedAnnotation is None:
@@ -392,6 +422,7 @@ class TutorialAnnotator(qt.QMainWindow):
         self.selectedAnnotation = selectedAnnotation
         self.selectedAnnotationType = AnnotationType.Selected
         self.selectedAnnotation.drawBoundingBox = True
+        self.selectedAnnotator.MarkDirty()
 
     def previewAnnotation(self, appPos):
         if self.selectedAnnotator is None:
@@ -410,6 +441,7 @@ class TutorialAnnotator(qt.QMainWindow):
                                       _helperPos[1] - self.selectedAnnotation.target["position"][1]]
 
             self.selectedAnnotation.setValuesOffset(*offsetFromTargetWidget)
+            self.selectedAnnotator.MarkDirty()
 
         if self.selectedAnnotationType == AnnotationType.Selected:
             self.OptHelperWidget.SetActive(self.selectedAnnotation.wantsOptHelper())
@@ -458,12 +490,40 @@ class TutorialAnnotator(qt.QMainWindow):
         pass
 
     def refreshViews(self):
-        if self.selectedAnnotator is None:
+        # Only the slides changed since the last refresh are drawn again
+        if self.selectedAnnotator is None or not self.selectedAnnotator.NeedsRedraw():
             return
         self.selectedAnnotator.ReDraw()
         self.selectedSlideWidget.setPixmap(self.selectedAnnotator.GetResized(*self.selectedSlideSize, keepAspectRatio=True))
         pass
 
+    def updateVisibleThumbnails(self):
+        # One page above and below the visible area is drawn in advance for smooth scrolling
+        viewport = self.slidesScrollArea.viewport()
+        scrollValue = self.slidesScrollArea.verticalScrollBar().value
+        visibleArea = qt.QRect(0, scrollValue - viewport.height, viewport.width, 3*viewport.height)
+        for slide in self.slides:
+            if not slide.thumbnailStale or not slide.geometry.intersects(visibleArea):
+                continue
+            if slide.Slide.IsImageLoaded():
+                slide.UpdateThumbnail()
+            elif id(slide.Slide) not in self.decodingSlides:
+                # Decoded in the background, the thumbnail is drawn when it's ready
+                self.decodingSlides.add(id(slide.Slide))
+                self.imageLoader.submit(slide.Slide.DecodeImage, functools.partial(self.slideImageDecoded, self.loadGeneration, slide))
+        pass
+
+    def slideImageDecoded(self, generation, slideWidget, image):
+        if generation != self.loadGeneration:
+            return
+        self.decodingSlides.discard(id(slideWidget.Slide))
+        if slideWidget not in self.slides:
+            return
+        if image is not None:
+            slideWidget.Slide.ProvideImage(image)
+        slideWidget.UpdateThumbnail()
+        pass
+
     def forceTutorialOutputName(self, name):
         self.outputName = name
         pass
@@ -518,6 +578,7 @@ class TutorialAnnotator(qt.QMainWindow):
                 else:
                     self.selectedAnnotation.text += event.text()
 
+                self.selectedAnnotator.MarkDirty()
             return True
 
         elif self.selectedAnnotator is not None and self.selectedAnnotation is not None:
@@ -557,14 +618,23 @@ class TutorialAnnotator(qt.QMainWindow):
         event.accept()
         return True
     
+    def closeEvent(self, event):
+        self.cancelLoading()
+        SlideImageCache.clear()
+        event.accept()
+
     def windowResizeEvent(self, event):
         mainScreenWidth = (self.slidesScrollArea.width * 3)
         ratio = mainScreenWidth/self.selectedSlideWidget.width
         mainScreenHeight = self.selectedSlideWidget.height * ratio
         self.selectedSlideSize = [mainScreenWidth, mainScreenHeight]
+        if self.selectedAnnotator is not None:
+            self.selectedAnnotator.MarkDirty()
 
         for slide in self.slides:
             slide._resizeEvent(event)
+        # The thumbnails marked stale are only redrawn once they are in view
+        qt.QTimer.singleShot(0, self.updateVisibleThumbnails)
         return True
 
     def eventFilter(self, obj, event):
@@ -603,45 +673,86 @@ class TutorialAnnotator(qt.QMainWindow):
         return False
             
             
+    def cancelLoading(self):
+        """Drop the loads of the tutorial open until now, the results still on their way are ignored"""
+        self.imageLoader.cancel()
+        self.loadGeneration += 1
+        self.decodingSlides.clear()
+
     def loadImagesAndMetadata(self, tutorialData):
+        # The steps are parsed on worker threads and added to the list in order as soon as they are
+        # ready, the images are decoded when their slide is first shown, see SlideImageCache
+        self.loadingSteps = {}
+        self.nextLoadingStep = 0
+        self.loadingStepCount = len(tutorialData.steps)
+        self.loadingProgress.setRange(0, self.loadingStepCount)
+        self.loadingProgress.setValue(0)
+        self.loadingProgress.setVisible(self.loadingStepCount > 0)
         for stepIndex, screenshots in enumerate(tutorialData.steps):
-            slideWidget = AnnotatorSlideWidget(stepIndex, self.thumbnailRatio, self.slidesScrollArea.widget())
+            self.imageLoader.submit(TutorialAnnotator.loadStep, functools.partial(self.addLoadedStep, self.loadGeneration, stepIndex),
+                                    screenshots, stepIndex < self.prefetchedSteps)
+
+    @staticmethod
+    def loadStep(screenshots, decodeImage):
+        # Runs on a worker thread, only QImage can be used here
+
+        #>>>>>> This assumes that the first window is always the SlicerAppMainWindow <<<<<<<
+
+        #Main window
+        if len(screenshots) > 1:
+            metadata = AnnotatedTutorial.GetCompositeMetadata(screenshots)
+            imageLoader = functools.partial(AnnotatedTutorial.LoadCompositeImage, screenshots)
+        else:
+            metadata = screenshots[0].getWidgets()
+            imageLoader = screenshots[0].loadImage
+        image = None
+        if decodeImage:
+            image = imageLoader()
+        return [metadata, imageLoader, screenshots[0].getImageSize(), image]
+
+    def addLoadedStep(self, generation, stepIndex, stepData):
+        if generation != self.loadGeneration:
+            return
+        self.loadingSteps[stepIndex] = stepData
+        while self.nextLoadingStep in self.loadingSteps:
+            stepData = self.loadingSteps.pop(self.nextLoadingStep)
+            self.nextLoadingStep += 1
+            self.loadingProgress.setValue(self.nextLoadingStep)
+            if stepData is None:
+                print(f"ERROR: Annotator Failed to add window in step:{self.nextLoadingStep - 1}, loadImagesAndMetadata")
+                continue
+
+            [metadata, imageLoader, imageSize, image] = stepData
+            annotatorSlide = AnnotatorSlide(None, metadata, ImageLoader=imageLoader, ImageSize=imageSize)
+            annotatorSlide.SlideLayout = "Screenshot"
+            if image is not None:
+                annotatorSlide.ProvideImage(image)
+
+            slideWidget = AnnotatorSlideWidget(len(self.slides), self.thumbnailRatio, self.slidesScrollArea.widget())
             slideWidget.thumbnailClicked.connect(self.changeSelectedSlide)
             slideWidget.swapRequest.connect(self.swapSlidePosition)
+            slideWidget.SetTutorialSlide(annotatorSlide)
 
-            #>>>>>> This assumes that the first window is always the SlicerAppMainWindow <<<<<<<
-
-            #Main window
-            if len(screenshots) > 1:
-                try:
-                    cImage, cMetadata = AnnotatedTutorial.GetCompositeSlide(screenshots)
-                    annotatorSlide = AnnotatorSlide(cImage, cMetadata)
-                    annotatorSlide.SlideLayout = "Screenshot"
-                    slideWidget.SetTutorialSlide(annotatorSlide)
-                except Exception as e:
-                    print(e)
-                    print(f"ERROR: Annotator Failed to add window in step:{stepIndex}, loadImagesAndMetadata")
-                    continue
-
-            else:
-                try:
-                    annotatorSlide = AnnotatorSlide(screenshots[0].getImage(), screenshots[0].getWidgets())
-                    annotatorSlide.SlideLayout = "Screenshot"
-                    slideWidget.SetTutorialSlide(annotatorSlide)
-                except Exception:
-                    print(f"ERROR: Annotator Failed to add top level window in step:{stepIndex}, loadImagesAndMetadata")
-                    del slideWidget
-                    continue
-                
+            self.slides.append(slideWidget)
+            self.slide_gridLayout.addWidget(slideWidget)
+            slideWidget._resizeEvent(None)
 
-            self.slides.append(slideWidget)  # noqa: F821
-            self.slide_gridLayout.addWidget(slideWidget)  # noqa: F821
-        def callback():
-            self.windowResizeEvent(None)
-            self.changeSelectedSlide(0)
-        qt.QTimer.singleShot(100, callback)
+            if len(self.slides) == 1:
+                def callback():
+                    self.windowResizeEvent(None)
+                    self.slide_gridLayout.activate()
+                    self.updateVisibleThumbnails()
+                    self.changeSelectedSlide(0)
+                qt.QTimer.singleShot(100, callback)
+
+        if self.nextLoadingStep >= self.loadingStepCount:
+            self.loadingProgress.hide()
+        pass
 
     def openJsonFile(self, filepath):
+        # The loads and full resolution images of the tutorial open until now
+        self.cancelLoading()
+        SlideImageCache.clear()
         directory_path = os.path.dirname(filepath)
         # Read the data from the file
         with open(filepath, encoding='utf-8') as file:
@@ -697,6 +808,7 @@ class AnnotatorSlideWidget(qt.QWidget):
 
         self.Slide : AnnotatorSlide = None
         self.SlideWidget : tmLabel = None
+        self.thumbnailStale = True
 
         self.SetupGUI()
         
@@ -757,14 +869,24 @@ class AnnotatorSlideWidget(qt.QWidget):
         if scrollViewport is None:
             return
         scrollareaWidth = scrollViewport.width - 25
-        scaleFactor = scrollareaWidth/self.Slide.image.width()
-        self.thumbnailSize = [scrollareaWidth, scaleFactor*self.Slide.image.height()]
-        self.SlideWidget.setPixmap(self.Slide.GetResized(*self.thumbnailSize))
+        imageWidth, imageHeight = self.Slide.ImageSize()
+        scaleFactor = scrollareaWidth/imageWidth
+        self.thumbnailSize = [scrollareaWidth, scaleFactor*imageHeight]
+        # The label keeps the thumbnail size, the pixmap itself is set by UpdateThumbnail once visible
+        self.SlideWidget.setFixedSize(int(self.thumbnailSize[0]), int(self.thumbnailSize[1]))
+        self.thumbnailStale = True
 
         self.slideUpButton.move(self.thumbnailSize[0] - 50, 10)
         self.slideDownButton.move(self.thumbnailSize[0] - 20, 10)
         pass
 
+    def UpdateThumbnail(self):
+        if not self.thumbnailStale or self.Slide is None:
+            return
+        self.SlideWidget.setPixmap(self.Slide.GetResized(*self.thumbnailSize))
+        self.thumbnailStale = False
+        pass
+
     def mousePressEvent(self, event):
         pass
     def mouseMoveEvent(self, event):
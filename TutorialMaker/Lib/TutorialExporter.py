@@ -1,5 +1,61 @@
+import os
+import base64
 import qt
 
+class InlineImages():
+    """Embeds the slide images in the HTML as data URIs, the tutorial is then a single file.
+
+    The images are scaled down to width (never up) and encoded with QImageWriter in format at
+    quality. The srcsetWidths variants are listed in srcset, so browsers on small screens
+    download less. A format the Qt image plugins cannot write falls back to JPEG, then PNG.
+    """
+    mimeTypes = {"png": "image/png", "jpeg": "image/jpeg", "jpg": "image/jpeg", "webp": "image/webp"}
+
+    def __init__(self, imageFolder: str, width: int = 1280, format: str = "webp", quality: int = 80, srcsetWidths: tuple = (480, 960)):
+        self.imageFolder = imageFolder
+        self.width = width
+        self.format = InlineImages.supportedFormat(format)
+        self.quality = quality
+        self.srcsetWidths = srcsetWidths
+
+    @staticmethod
+    def supportedFormat(format: str):
+        # Depending on the PythonQt version the formats are QByteArray or bytes
+        supported = []
+        for value in qt.QImageWriter.supportedImageFormats():
+            if hasattr(value, "data"):
+                value = value.data()
+            supported.append(bytes(value).decode("ascii").lower())
+        for candidate in [format.lower(), "jpeg", "png"]:
+            if candidate in supported and candidate in InlineImages.mimeTypes:
+                return candidate
+        return "png"
+
+    def Encode(self, imagePath: str):
+        """[src, srcset] of an image, the path is kept as the src if it cannot be read"""
+        image = qt.QImage(os.path.join(self.imageFolder, imagePath))
+        if image.isNull():
+            return [imagePath, ""]
+        widths = sorted({min(width, image.width()) for width in [*self.srcsetWidths, self.width]})
+        variants = []
+        for width in widths:
+            scaled = image if width == image.width() else image.scaledToWidth(width, qt.Qt.SmoothTransformation)
+            variants.append(f"{self.__DataUri(scaled)} {width}w")
+        src = variants[-1].rsplit(" ", 1)[0]
+        return [src, ", ".join(variants) if len(variants) > 1 else ""]
+
+    def __DataUri(self, image):
+        if self.format == "jpeg":
+            # No alpha channel in JPEG
+            image = image.convertToFormat(qt.QImage.Format_RGB32)
+        buffer = qt.QBuffer()
+        buffer.open(qt.QIODevice.WriteOnly)
+        writer = qt.QImageWriter(buffer, self.format)
+        writer.setQuality(self.quality)
+        if not writer.write(image):
+            raise OSError(f"Could not encode an image as {self.format}: {writer.errorString()}")
+        return f"data:{InlineImages.mimeTypes[self.format]};base64,{base64.b64encode(buffer.data().data()).decode('ascii')}"
+
 class CoverSlide():
     def __init__(self, title: str, author: str, date: str, description: str):
         self.Title = title
@@ -8,7 +64,7 @@ class CoverSlide():
         self.Description = description
         pass
     
-    def ToHtml(self):
+    def ToHtml(self, images: InlineImages = None):
         return  """
                 <div class="cover">
                     <h1 class="coverTitle">{}</h1>
@@ -25,7 +81,7 @@ class BackCoverSlide():
         self.Title = title
         self.Acknowledgments = Acknowledgments 
     
-    def ToHtml(self):
+    def ToHtml(self, images: InlineImages = None):
         if isinstance(self.Acknowledgments, dict):
             items = "".join(
                 f"<li><h2><strong>{k}</strong><br>{v}</h2></li>"
@@ -59,16 +115,22 @@ class SimpleSlide():
         self.Description = Description
         self.ImagePath = ImagePath
         
-    def ToHtml(self):
+    def ToHtml(self, images: InlineImages = None):
+        imageAttributes = f'src="{self.ImagePath}"'
+        if images is not None:
+            [src, srcset] = images.Encode(self.ImagePath)
+            imageAttributes = f'src="{src}"'
+            if srcset != "":
+                imageAttributes += f' srcset="{srcset}" sizes="85vw"'
         return  """
                     <div class="slide">
                         <h1 class="slideTitle">{}</h1>
                         <div class="containerImage">
-                            <img class="slideImage" src="{}">
+                            <img class="slideImage" {}>
                         </div>
                         <h3 class="slideDescription">{}</h3>
                     </div>
-                """.format(self.Title, self.ImagePath, self.Description)
+                """.format(self.Title, imageAttributes, self.Description)
     
     def ToMarkdown(self):
         title_html = f"""<div style="background-color:#003366; color:white; padding:10px; text-align:center; font-size:24px; font-weight:bold;">{self.Title}</div>"""
@@ -104,8 +166,9 @@ class TutorialExporter():
                     """
         self.Markdown = ""
         
-    def ToHtml(self):
-        body = "".join([slide.Model.ToHtml() for slide in self.Slides])
+    def ToHtml(self, images: InlineImages = None):
+        # With images the slide images are embedded, otherwise they are links to the files next to the HTML
+        body = "".join([slide.Model.ToHtml(images) for slide in self.Slides])
         return self.Html.format(self.Title, body, self.htmlStyle)
     
     def ToMarkdown(self):
@@ -2,9 +2,12 @@ import slicer
 import qt
 import json
 import os
+import logging
 import copy
-from Lib.Annotations import Annotation, AnnotationType, AnnotatorSlide, AnnotatedTutorial
-from Lib.TutorialUtils import Tutorial, TutorialScreenshot
+import functools
+from Lib.Annotations import Annotation, AnnotationType, AnnotatorSlide, AnnotatedTutorial, SlideImageCache
+from Lib.TutorialUtils import Tutorial, TutorialScreenshot, BackgroundLoader, Util, get_output_path
+from Lib.AnnotationJournal import AnnotationJournal
 
 import slicer
 from slicer.i18n import tr as _
@@ -80,6 +83,8 @@ class AnnotatorStepWidget(qt.QWidget):
 
         self.Slides = []
         self.SlideWidgets = []
+        # Indexes of the windows with their thumbnail drawn, see UpdateThumbnails
+        self.drawnThumbnails = set()
 
         self.SetupGUI()
 
@@ -127,7 +132,8 @@ class AnnotatorStepWidget(qt.QWidget):
         self.SlideWidgets.append(screenshotWidget)
 
         self.Slides.append(annotatorSlide)
-        screenshotWidget.setPixmap(annotatorSlide.GetResized(*self.thumbnailSize))
+        # The thumbnail is drawn by UpdateThumbnails once the step is scrolled into view
+        screenshotWidget.setMinimumSize(int(self.thumbnailSize[0]), int(self.thumbnailSize[1]))
         screenshotWidget.setSizePolicy(qt.QSizePolicy.Expanding, qt.QSizePolicy.Expanding)
         screenshotWidget.clicked.connect(lambda screen= self.screenshotCount: self.thumbnailClick(screen))
 
@@ -148,18 +154,27 @@ class AnnotatorStepWidget(qt.QWidget):
         self.thumbnailClicked.emit(self.stepIndex, screenshotIndex)
         pass
 
-    def CreateMergedWindow(self):
-        if(len(self.Slides) < 2):
-            self.expandButton.hide()
-            return
-        finalImage = self.Slides[0].image.toImage()
-        finalJson = copy.deepcopy(self.Slides[0].metadata)
+    def UpdateThumbnails(self, loadedOnly=False):
+        """Draw the thumbnails shown and not drawn yet, returns the slides left out as not loaded"""
+        notLoaded = []
+        for slideIndex, slideWidget in enumerate(self.SlideWidgets):
+            if slideIndex in self.drawnThumbnails or slideWidget.isHidden():
+                continue
+            if loadedOnly and not self.Slides[slideIndex].IsImageLoaded():
+                notLoaded.append(self.Slides[slideIndex])
+                continue
+            slideWidget.setPixmap(self.Slides[slideIndex].GetResized(*self.thumbnailSize))
+            self.drawnThumbnails.add(slideIndex)
+        return notLoaded
+
+    @staticmethod
+    def MergeWindowImages(slides : list[AnnotatorSlide]):
+        # Also used from the loading threads, only QImage can be used here
+        finalImage = slides[0].DecodeImage()
         painter = qt.QPainter(finalImage)
-        for slide in self.Slides[1:]:
-
-            finalJson.extend(copy.deepcopy(slide.metadata))
+        for slide in slides[1:]:
 
-            nextImage = slide.image.toImage()
+            nextImage = slide.DecodeImage()
 
             mainWidget = slide.metadata[0]
             painter.drawImage(qt.QRect(mainWidget["position"][0],
@@ -168,7 +183,19 @@ class AnnotatorStepWidget(qt.QWidget):
                                        nextImage.height()),
                                        nextImage)
         painter.end()
-        mergedSlide = AnnotatorSlide(qt.QPixmap().fromImage(finalImage), finalJson)
+        return finalImage
+
+    def CreateMergedWindow(self):
+        if(len(self.Slides) < 2):
+            self.expandButton.hide()
+            return
+        finalJson = copy.deepcopy(self.Slides[0].metadata)
+        for slide in self.Slides[1:]:
+            finalJson.extend(copy.deepcopy(slide.metadata))
+        # Merged only when first shown, like the windows themselves
+        mergedSlide = AnnotatorSlide(None, finalJson,
+                                     ImageLoader=functools.partial(AnnotatorStepWidget.MergeWindowImages, list(self.Slides)),
+                                     ImageSize=self.Slides[0].ImageSize())
         mergedSlide.SlideLayout = "Screenshot" 
 
         self.mergedSlideIndex = self.screenshotCount
@@ -216,6 +243,12 @@ class TutorialGUI(qt.QMainWindow):
 
         self.steps = []
 
+        # Screenshots of the steps scrolled into view are decoded on worker threads
+        self.imageLoader = BackgroundLoader()
+        self.decodingSlides = set()
+        # Incremented by cancelLoading, the results of the loads submitted before are dropped
+        self.loadGeneration = 0
+
         self.updateTimer = qt.QTimer()
         self.updateTimer.setTimerType(qt.Qt.PreciseTimer)
         self.updateTimer.setInterval(34) #34ms Interval = 30 ups
@@ -240,7 +273,20 @@ class TutorialGUI(qt.QMainWindow):
         self.defaultHelperOffset = [60,60]
 
         # TODO: Get a better way to get the module position
-        self.outputFolder = f"{os.path.dirname(__file__)}/../Outputs/Annotations"
+        self.outputFolder = f"{get_output_path()}/Annotations"
+
+        # Edits since the last load or save, replayed after a crash. The slides are named by a key
+        # given in the order they were loaded, the step and slide indexes change when reordering
+        self.journal = AnnotationJournal(f"{self.outputFolder}/annotations.journal")
+        self.journalKeys = {}
+        self.journalSlides = []
+        self.replayingJournal = False
+        # [annotation, StateKey] of the selected annotation as last written to the journal
+        self.journaledAnnotation = [None, None]
+        # [slide, title, body] as last written to the journal
+        self.journaledSlideText = [None, "", ""]
+        # The text boxes are being filled with the selected slide, not edited
+        self.showingSlideText = False
 
         # Need to do a overhaul of the preview function so this isn't necessary
         self.lastAppPos = qt.QPoint()
@@ -312,6 +358,11 @@ class TutorialGUI(qt.QMainWindow):
         self.scroll_area.setAcceptDrops(True)
         self.scroll_area.installEventFilter(self)
 
+        # Thumbnails are only drawn for the steps scrolled into view
+        scrollBar = self.scroll_area.verticalScrollBar()
+        scrollBar.valueChanged.connect(lambda value: self.updateVisibleThumbnails())
+        scrollBar.rangeChanged.connect(lambda minimum, maximum: self.updateVisibleThumbnails())
+
         # Configure Main Slide Screen
         self.selectedSlide = self.uiWidget.findChild(qt.QLabel, "label_imagen")
         self.selectedSlide.setFixedSize(*self.selectedSlideSize)
@@ -331,6 +382,10 @@ class TutorialGUI(qt.QMainWindow):
         #self.slideBodyWidget.setFixedSize(self.selectedSlideSize[0], 150)
         self.slideBodyWidget.placeholderText = _("Write a description for the slide")
 
+        # The text edits are journaled when they are made, not polled by refreshViews
+        self.slideTitleWidget.textChanged.connect(self.slideTextChanged)
+        self.slideBodyWidget.textChanged.connect(self.slideTextChanged)
+
         # Load Used Resources
         resourceFolder = os.path.dirname(__file__) + '/../Resources'
         self.image_ChevronUp = qt.QImage(f'{resourceFolder}/Icons/ScreenshotAnnotator/chevron_up.png').scaled(20,20, qt.Qt.KeepAspectRatio, qt.Qt.SmoothTransformation)
@@ -346,6 +401,9 @@ class TutorialGUI(qt.QMainWindow):
         pass
 
     def _loadAnnotationsFromFile(self, filepath):
+        # The loads and full resolution images of the tutorial open until now
+        self.cancelLoading()
+        SlideImageCache.clear()
         self.selectedAnnotator = None
         self.selectedAnnotation = None
         self.selectedIndexes = [0, 0]
@@ -389,15 +447,15 @@ class TutorialGUI(qt.QMainWindow):
         else:
             self.slideTitleWidget.setText("")
             self.slideBodyWidget.setText("")
+        self.restoreJournal(filepath)
+        qt.QTimer.singleShot(100, self.updateVisibleThumbnails)
 
     def openAnnotationsAsJSON(self):
-        from Lib.TutorialUtils import get_module_basepath as getModulePath
         parent = slicer.util.mainWindow()
-        basePath = getModulePath("TutorialMaker")
         jsonPath = qt.QFileDialog.getOpenFileName(
             parent,
             _("Select a JSON file"),
-            basePath + "/Outputs/Annotations/",              
+            get_output_path() + "/Annotations/",              
             _("JSON Files (*.json)") 
         )
         self.raise_()
@@ -412,15 +470,14 @@ class TutorialGUI(qt.QMainWindow):
     def saveAnnotationsAsJSON(self):
         import re
         
-        if self.selectedAnnotator is not None:
-            self.selectedAnnotator.SlideTitle = self.slideTitleWidget.text
-            self.selectedAnnotator.SlideBody = self.slideBodyWidget.toPlainText()
+        self.storeSelectedSlideText()
         
         outputFileAnnotations = {**self.tutorialInfo}
         outputFileTextDict = {}
         outputFileOld = []
 
         outputFileAnnotations["slides"] = []
+        savedSlides = []
 
         for stepIndex, step in enumerate(self.steps):
             for slideIndex, slide in enumerate(step.Slides):
@@ -429,8 +486,6 @@ class TutorialGUI(qt.QMainWindow):
                 layoutName = getattr(slide, "SlideLayout", "")
                 if (not slide.Active) and layoutName not in ("CoverPage", "Acknowledgment"):
                     continue
-                slideImage = slide.image
-
                 cleanSlideTitle = slide.SlideTitle.replace(' ', '')
                 cleanSlideTitle = re.sub(r'[^a-zA-Z0-9]', '', cleanSlideTitle)
 
@@ -440,10 +495,12 @@ class TutorialGUI(qt.QMainWindow):
                 if cleanSlideTitle == "":
                     slideTitle += "slide"
                     slideImagePath += "slide"
-                slideImage.save(slideImagePath + ".png", "PNG")
+                # Only written when the image changed since it was last saved there
+                slide.SaveImage(slideImagePath + ".png")
 
-                textDict = {f"{slideTitle}_title": slide.SlideTitle,
-                            f"{slideTitle}_body": slide.SlideBody}
+                # One dictionary for the whole tutorial, filled in place
+                outputFileTextDict[f"{slideTitle}_title"] = slide.SlideTitle
+                outputFileTextDict[f"{slideTitle}_body"] = slide.SlideBody
 
                 slideInfo = {"ImagePath": f"{slideTitle}.png",
                              "SlideCode": f"{stepIndex}/{slideIndex}",
@@ -454,7 +511,7 @@ class TutorialGUI(qt.QMainWindow):
 
                 for annIndex, annotation in enumerate(slide.annotations):
                     info = annotation.toDict()
-                    textDict[f"{slidePrefix}_{info['type']}_{annIndex}"] = info["text"]
+                    outputFileTextDict[f"{slidePrefix}_{info['type']}_{annIndex}"] = info["text"]
                     slideInfo["Annotations"].append({"widgetPath": info["widgetPath"],
                                                      "type": info["type"],
                                                      "offset": info["offset"],
@@ -464,14 +521,14 @@ class TutorialGUI(qt.QMainWindow):
                                                       "text": f"{slidePrefix}_{info['type']}_{annIndex}"})
                     pass
                 outputFileAnnotations["slides"].append(slideInfo)
-                outputFileTextDict = {**outputFileTextDict, **textDict}
+                savedSlides.append(slide)
             pass
 
-        with open(file= f"{self.outputFolder}/annotations.json", mode='w', encoding="utf-8") as fd:
-            json.dump(outputFileAnnotations, fd, ensure_ascii=False, indent=4)
+        Util.writeJSONAtomic(outputFileAnnotations, f"{self.outputFolder}/annotations.json")
+        Util.writeJSONAtomic(outputFileTextDict, f"{self.outputFolder}/text_dict_default.json")
 
-        with open(file= f"{self.outputFolder}/text_dict_default.json", mode='w', encoding="utf-8") as fd:
-            json.dump(outputFileTextDict, fd, ensure_ascii=False, indent=4)
+        # The edits are in annotations.json now, opening it again gives one step per saved slide
+        self.startJournal(f"{self.outputFolder}/annotations.json", savedSlides)
 
         slicer.util.infoDisplay(_("Tutorial files have been saved at:\n{path}").format(path=self.outputFolder), windowTitle=_("Tutorial saved"))
         
@@ -480,6 +537,181 @@ class TutorialGUI(qt.QMainWindow):
 
 
 
+    def storeSelectedSlideText(self):
+        if self.selectedAnnotator is None or self.replayingJournal:
+            return
+        title = self.slideTitleWidget.text
+        body = self.slideBodyWidget.toPlainText()
+        if title != self.selectedAnnotator.SlideTitle or body != self.selectedAnnotator.SlideBody:
+            self.journalRecord("slide_text", slide=self.journalKeys.get(id(self.selectedAnnotator)), title=title, body=body)
+        self.selectedAnnotator.SlideTitle = title
+        self.selectedAnnotator.SlideBody = body
+        self.journaledSlideText = [self.selectedAnnotator, title, body]
+
+    def startJournal(self, basePath, slides=None, keepOperations=False):
+        """Journal the edits made from now on to the tutorial loaded from basePath, slides are the ones it loads"""
+        if slides is None:
+            slides = [slide for step in self.steps for slide in step.Slides]
+        self.journalSlides = []
+        self.journalKeys = {}
+        for slide in slides:
+            self.addJournalSlide(slide)
+        self.journaledAnnotation = [None, None]
+        # Without a refresh to catch up, the first edit of the shown slide must already be journaled
+        self.journaledSlideText = [self.selectedAnnotator, self.slideTitleWidget.text, self.slideBodyWidget.toPlainText()]
+        self.journal.start({"base": os.path.abspath(basePath), "slides": len(slides)}, keepOperations)
+
+    def restoreJournal(self, basePath):
+        """Offer to replay the edits journaled but never saved the last time basePath was open"""
+        # Writes the last edits of the tutorial open until now, start() runs the writer again
+        self.journal.close()
+        [header, operations] = self.journal.read()
+        slides = [slide for step in self.steps for slide in step.Slides]
+        if header is None or len(operations) == 0 or header.get("base") != os.path.abspath(basePath) or header.get("slides") != len(slides):
+            self.startJournal(basePath, slides)
+            return
+        restore = slicer.util.confirmYesNoDisplay(_("This tutorial has {count} annotator changes that were not saved. Restore them?").format(count=len(operations)),
+                                                  windowTitle=_("Restore annotations"))
+        self.raise_()
+        self.activateWindow()
+        if not restore:
+            self.startJournal(basePath, slides)
+            return
+        self.startJournal(basePath, slides, keepOperations=True)
+        self.replayingJournal = True
+        try:
+            for operation in operations:
+                self.applyJournalOperation(operation)
+            if len(self.steps) > 0 and len(self.steps[0].Slides) > 0:
+                self.changeSelectedSlide(0, 0)
+        except Exception:
+            logging.exception("Could not replay the annotation journal")
+        finally:
+            self.replayingJournal = False
+        qt.QTimer.singleShot(0, self.updateVisibleThumbnails)
+
+    def applyJournalOperation(self, operation):
+        op = operation["op"]
+        if op == "image_add":
+            self.insertScreenshotStep(TutorialScreenshot(operation["window"], operation["metadata"]), operation["index"])
+            return
+        if op == "step_order":
+            self.reorderSteps(operation["steps"])
+            return
+
+        slide = self.journalSlides[operation["slide"]]
+        if op == "annotation_add":
+            slide.annotations.insert(operation["index"], self.annotationFromJournal(slide, operation["annotation"]))
+        elif op == "annotation_update":
+            slide.annotations[operation["index"]] = self.annotationFromJournal(slide, operation["annotation"])
+        elif op == "annotation_remove":
+            del slide.annotations[operation["index"]]
+        elif op == "slide_text":
+            slide.SlideTitle = operation["title"]
+            slide.SlideBody = operation["body"]
+        elif op == "slide_copy":
+            for stepIndex, step in enumerate(self.steps):
+                if slide in step.Slides:
+                    self.changeSelectedSlide(stepIndex, step.Slides.index(slide))
+                    self.copy_page()
+                    break
+        else:
+            logging.warning(f"Unknown annotation journal operation {op}")
+        slide.MarkDirty()
+
+    @staticmethod
+    def annotationFromJournal(slide, annotationData):
+        targetWidget = slide.FindWidgetByPath(annotationData["widgetPath"])
+        if targetWidget is None:
+            targetWidget = {
+                "position": [0,0],
+                "size": [1,1]
+            }
+        annotation = Annotation(
+            targetWidget,
+            *annotationData["offset"],
+            *annotationData["optional"],
+            annotationData["text"],
+            AnnotationType[annotationData["type"]]
+        )
+        annotation.penConfig(
+            qt.QColor(annotationData["penSettings"]["color"]),
+            annotationData["penSettings"]["fontSize"],
+            annotationData["penSettings"]["thickness"],
+            brush=True
+        )
+        annotation.PERSISTENT = True
+        annotation.setOffset(slide.windowOffset)
+        return annotation
+
+    def reorderSteps(self, stepKeys):
+        # The steps are put in the order of their first slide in stepKeys, a step may hold several windows
+        positions = {}
+        for keys in stepKeys:
+            for key in keys:
+                positions[key] = len(positions)
+        def stepPosition(step):
+            return min([positions[self.journalKeys[id(slide)]] for slide in step.Slides
+                        if self.journalKeys.get(id(slide)) in positions], default=len(positions))
+        self.steps.sort(key=stepPosition)
+        for idx, step in enumerate(self.steps):
+            step.stepIndex = idx
+            self.gridLayout.addWidget(step, idx, 0)
+        self.coverStepIndex = self._findStepIndexByLayout("CoverPage")
+        self.ackStepIndex = self._findStepIndexByLayout("Acknowledgment")
+
+    def addJournalSlide(self, slide):
+        # Given in the same order when replaying, so the keys written in the journal stay valid
+        key = len(self.journalSlides)
+        self.journalSlides.append(slide)
+        self.journalKeys[id(slide)] = key
+        return key
+
+    def journalRecord(self, op, **fields):
+        if self.replayingJournal or fields.get("slide", 0) is None:
+            return
+        self.journal.record(op, **fields)
+
+    def journalStepOrder(self):
+        self.journalRecord("step_order", steps=[[self.journalKeys[id(slide)] for slide in step.Slides if id(slide) in self.journalKeys]
+                                                for step in self.steps])
+
+    def journalAnnotation(self, op, annotation):
+        slideKey = self.journalKeys.get(id(self.selectedAnnotator))
+        if slideKey is None:
+            return
+        fields = {}
+        if op != "annotation_remove":
+            # Annotations on a widget missing from the metadata have no path to write
+            if "path" not in annotation.target:
+                return
+            fields["annotation"] = annotation.toDict()
+        self.journalRecord(op, slide=slideKey, index=self.selectedAnnotator.annotations.index(annotation), **fields)
+        self.journaledAnnotation = [annotation, annotation.StateKey()]
+
+    def journalSelectedAnnotation(self):
+        """Write the selected annotation to the journal if it changed since it was last written"""
+        annotation = self.selectedAnnotation
+        if annotation is None or not annotation.PERSISTENT:
+            return
+        if self.journaledAnnotation[0] is not annotation:
+            self.journaledAnnotation = [annotation, annotation.StateKey()]
+        elif self.journaledAnnotation[1] != annotation.StateKey():
+            self.journalAnnotation("annotation_update", annotation)
+
+    def slideTextChanged(self, *args):
+        if self.showingSlideText:
+            return
+        self.journalSlideText()
+
+    def journalSlideText(self):
+        if self.selectedAnnotator is None:
+            return
+        texts = [self.selectedAnnotator, self.slideTitleWidget.text, self.slideBodyWidget.toPlainText()]
+        if self.journaledSlideText[0] is texts[0] and self.journaledSlideText[1:] != texts[1:]:
+            self.journalRecord("slide_text", slide=self.journalKeys.get(id(texts[0])), title=texts[1], body=texts[2])
+        self.journaledSlideText = texts
+
     def deleteSelectedAnnotation(self):
         self.selectedAnnotation = None
         if self.selectedAnnotationType == AnnotationType.Selected:
@@ -493,6 +725,12 @@ class TutorialGUI(qt.QMainWindow):
         self.outputName = name
         pass
 
+    def cancelLoading(self):
+        """Drop the loads of the tutorial open until now, the results still on their way are ignored"""
+        self.imageLoader.cancel()
+        self.loadGeneration += 1
+        self.decodingSlides.clear()
+
     def loadImagesAndMetadata(self, tutorialData):
         for stepIndex, screenshots in enumerate(tutorialData.steps):
             stepWidget = AnnotatorStepWidget(stepIndex, self.thumbnailSize, parent=self)
@@ -501,9 +739,12 @@ class TutorialGUI(qt.QMainWindow):
 
             #>>>>>> This assumes that the first window is always the SlicerAppMainWindow <<<<<<<
 
+            # The images are decoded when the slide is first shown, see SlideImageCache
             #Main window
             try:
-                annotatorSlide = AnnotatorSlide(screenshots[0].getImage(), screenshots[0].getWidgets())
+                annotatorSlide = AnnotatorSlide(None, screenshots[0].getWidgets(),
+                                                ImageLoader=screenshots[0].loadImage,
+                                                ImageSize=screenshots[0].getImageSize())
                 annotatorSlide.SlideLayout = "Screenshot"
                 stepWidget.AddStepWindows(annotatorSlide)
             except Exception:
@@ -513,9 +754,11 @@ class TutorialGUI(qt.QMainWindow):
 
             for screenshot in screenshots[1:]:
                 try:
-                    annotatorSlide = AnnotatorSlide(screenshot.getImage(),
+                    annotatorSlide = AnnotatorSlide(None,
                                                     screenshot.getWidgets(),
-                                                    WindowOffset=screenshot.getWidgets()[0]["position"])
+                                                    WindowOffset=screenshot.getWidgets()[0]["position"],
+                                                    ImageLoader=screenshot.loadImage,
+                                                    ImageSize=screenshot.getImageSize())
                     annotatorSlide.SlideLayout = "Screenshot"
                     stepWidget.AddStepWindows(annotatorSlide)  # noqa: F821
                 except Exception:
@@ -540,6 +783,34 @@ class TutorialGUI(qt.QMainWindow):
         
         if len(self.steps) > 0 and len(self.steps[0].Slides) > 0:
             self.changeSelectedSlide(0, 0)
+        qt.QTimer.singleShot(100, self.updateVisibleThumbnails)
+        pass
+
+    def updateVisibleThumbnails(self):
+        # One page above and below the visible area is drawn in advance for smooth scrolling
+        viewport = self.scroll_area.viewport()
+        scrollValue = self.scroll_area.verticalScrollBar().value
+        visibleArea = qt.QRect(0, scrollValue - viewport.height, viewport.width, 3*viewport.height)
+        for step in self.steps:
+            if not step.geometry.intersects(visibleArea):
+                continue
+            for slide in step.UpdateThumbnails(loadedOnly=True):
+                if id(slide) in self.decodingSlides:
+                    continue
+                # The thumbnail is drawn when the image is ready
+                self.decodingSlides.add(id(slide))
+                self.imageLoader.submit(slide.DecodeImage, functools.partial(self.slideImageDecoded, self.loadGeneration, step, slide))
+        pass
+
+    def slideImageDecoded(self, generation, step, slide, image):
+        if generation != self.loadGeneration:
+            return
+        self.decodingSlides.discard(id(slide))
+        if step not in self.steps:
+            return
+        if image is not None:
+            slide.ProvideImage(image)
+        step.UpdateThumbnails()
         pass
 
     def swapStepPosition(self, index, swapTo):
@@ -553,15 +824,15 @@ class TutorialGUI(qt.QMainWindow):
         self.steps[index] = tmp
         self.steps[index].stepIndex = index
         self.gridLayout.addWidget(self.steps[index], index, 0)
+        self.journalStepOrder()
+        qt.QTimer.singleShot(0, self.updateVisibleThumbnails)
         pass
 
     def changeSelectedSlide(self, stepId, screenshotId):
         self.cancelCurrentAnnotation()
 
         # Save text to slideAnnotator
-        if self.selectedAnnotator is not None:
-            self.selectedAnnotator.SlideTitle = self.slideTitleWidget.text
-            self.selectedAnnotator.SlideBody = self.slideBodyWidget.toPlainText()
+        self.storeSelectedSlideText()
 
         # Change the slide variables
         self.selectedIndexes = [stepId, screenshotId]
@@ -570,25 +841,33 @@ class TutorialGUI(qt.QMainWindow):
 
         self.selectedSlide.setPixmap(selectedScreenshot.GetResized(*self.selectedSlideSize, keepAspectRatio=True))
         self.selectedAnnotator = selectedScreenshot
+        self.selectedAnnotator.MarkDirty()
 
         layout = getattr(selectedScreenshot, "SlideLayout", "")
         self._unbindEditorsFromCover()
         self._unbindEditorsFromAcknowledgment()
 
-        if layout == "CoverPage":
-            self._bindEditorsToCover()
-        elif layout == "Acknowledgment":
-            self._bindEditorsToAcknowledgment()
-        else:
-            self.slideTitleWidget.setText(self.selectedAnnotator.SlideTitle)
-            self.slideBodyWidget.setText(self.selectedAnnotator.SlideBody)
+        self.showingSlideText = True
+        try:
+            if layout == "CoverPage":
+                self._bindEditorsToCover()
+            elif layout == "Acknowledgment":
+                self._bindEditorsToAcknowledgment()
+            else:
+                self.slideTitleWidget.setText(self.selectedAnnotator.SlideTitle)
+                self.slideBodyWidget.setText(self.selectedAnnotator.SlideBody)
+        finally:
+            self.showingSlideText = False
+        self.journaledSlideText = [self.selectedAnnotator, self.slideTitleWidget.text, self.slideBodyWidget.toPlainText()]
 
 
     def cancelCurrentAnnotation(self):
         if self.selectedAnnotation is not None:
+            self.journalSelectedAnnotation()
             self.selectedAnnotation.drawBoundingBox = False
             if not self.selectedAnnotation.PERSISTENT:
                 self.selectedAnnotator.annotations.remove(self.selectedAnnotation)
+            self.selectedAnnotator.MarkDirty()
             self.selectedAnnotation = None
             if self.selectedAnnotationType == AnnotationType.Selected:
                 self.selectedAnnotationType = AnnotationType.Selecting
@@ -643,30 +922,8 @@ class TutorialGUI(qt.QMainWindow):
         if self.selected_image:
             try:
                 screenshot = self.selected_image[0]
-                image_pixmap = screenshot.getImage()
-                image_widgets = screenshot.getWidgets()
-                annotatorSlide = AnnotatorSlide(image_pixmap, image_widgets)
-                annotatorSlide.SlideLayout = "Screenshot"
-
-            
-                if not image_pixmap or image_pixmap.isNull():
-                    print("Image pixmap is null")
+                if not self.insertScreenshotStep(screenshot, insert_index):
                     return
-
-                stepWidget = AnnotatorStepWidget(len(self.steps), self.thumbnailSize, parent=self)
-                stepWidget.thumbnailClicked.connect(self.changeSelectedSlide)
-                stepWidget.swapRequest.connect(self.swapStepPosition)            
-                stepWidget.AddStepWindows(annotatorSlide) 
-
-                self.steps.insert(insert_index, stepWidget) 
-                while self.gridLayout.count():
-                    item = self.gridLayout.takeAt(0)
-                    widget = item.widget()
-                    if widget is not None:
-                        widget.setParent(None)
-                for idx, step in enumerate(self.steps):
-                    step.stepIndex =idx
-                    self.gridLayout.addWidget(step, idx, 0)  
                
                 self.selected_image[1].setStyleSheet("border: 2px solid transparent;")
                 self.selected_image = None
@@ -675,8 +932,36 @@ class TutorialGUI(qt.QMainWindow):
 
             except Exception as e:
                 print(f"Error: {str(e)}")
-        
-       
+
+    def insertScreenshotStep(self, screenshot, insert_index):
+        image_pixmap = screenshot.getImage()
+        image_widgets = screenshot.getWidgets()
+        annotatorSlide = AnnotatorSlide(image_pixmap, image_widgets)
+        annotatorSlide.SlideLayout = "Screenshot"
+
+        if not image_pixmap or image_pixmap.isNull():
+            print("Image pixmap is null")
+            return False
+
+        stepWidget = AnnotatorStepWidget(len(self.steps), self.thumbnailSize, parent=self)
+        stepWidget.thumbnailClicked.connect(self.changeSelectedSlide)
+        stepWidget.swapRequest.connect(self.swapStepPosition)
+        stepWidget.AddStepWindows(annotatorSlide)
+
+        self.steps.insert(insert_index, stepWidget)
+        while self.gridLayout.count():
+            item = self.gridLayout.takeAt(0)
+            widget = item.widget()
+            if widget is not None:
+                widget.setParent(None)
+        for idx, step in enumerate(self.steps):
+            step.stepIndex =idx
+            self.gridLayout.addWidget(step, idx, 0)
+
+        self.journalRecord("image_add", index=insert_index, window=screenshot.screenshot, metadata=screenshot.metadata,
+                           key=self.addJournalSlide(annotatorSlide))
+        self.journalStepOrder()
+        return True
 
 
 
@@ -684,9 +969,7 @@ class TutorialGUI(qt.QMainWindow):
         if self.selectedAnnotator is None:
             return
         
-        if self.selectedAnnotator is not None:
-            self.selectedAnnotator.SlideTitle = self.slideTitleWidget.text
-            self.selectedAnnotator.SlideBody = self.slideBodyWidget.toPlainText()
+        self.storeSelectedSlideText()
         
         stepIndex, slideIndex = self.selectedIndexes
         currentStep = self.steps[stepIndex]
@@ -695,11 +978,18 @@ class TutorialGUI(qt.QMainWindow):
         newPixmap = currentSlide.image.copy()
         
         newMetadata = copy.deepcopy(currentSlide.metadata)
+        newWindowOffset = copy.deepcopy(currentSlide.windowOffset)
 
         newAnnotations = []
+        newSlide = AnnotatorSlide(newPixmap, newMetadata, newAnnotations, newWindowOffset)
+
         for annotation in currentSlide.annotations:
+            # The copied annotations point to the widgets of the copied metadata
+            targetWidget = newSlide.FindWidgetByPath(annotation.target.get("path"))
+            if targetWidget is None:
+                targetWidget = copy.deepcopy(annotation.target)
             newAnnotation = Annotation(
-                TargetWidget=copy.deepcopy(annotation.target),
+                TargetWidget=targetWidget,
                 OffsetX=annotation.offsetX,
                 OffsetY=annotation.offsetY,
                 OptX=annotation.optX,
@@ -711,9 +1001,6 @@ class TutorialGUI(qt.QMainWindow):
             newAnnotation.PERSISTENT = annotation.PERSISTENT
             newAnnotations.append(newAnnotation)
         
-        newWindowOffset = copy.deepcopy(currentSlide.windowOffset)
-        
-        newSlide = AnnotatorSlide(newPixmap, newMetadata, newAnnotations, newWindowOffset)
         if currentSlide.SlideLayout == "Screenshot":
             newSlide.SlideLayout = "Copy"
         else:
@@ -745,12 +1032,18 @@ class TutorialGUI(qt.QMainWindow):
             self.coverStepIndex += 1
         if self.ackStepIndex is not None and self.ackStepIndex >= newStepIndex:
             self.ackStepIndex += 1
+
+        sourceKey = self.journalKeys.get(id(currentSlide))
+        if sourceKey is not None:
+            self.journalRecord("slide_copy", slide=sourceKey, key=self.addJournalSlide(newSlide))
+            self.journalStepOrder()
         
         self.changeSelectedSlide(newStepIndex, 0)
 
     def updateSelectedAnnotationSettings(self):
         if self.selectedAnnotation is not None:
             self.selectedAnnotation.penConfig(self.penSettings["color"], self.penSettings["fontSize"],self.penSettings["penThickness"], brush=True)
+            self.selectedAnnotator.MarkDirty()
 
     def updateAnnotationThicknessValue(self):
         self.penSettings["penThickness"] = self.spin_box.value
@@ -816,17 +1109,21 @@ class TutorialGUI(qt.QMainWindow):
         self.selectedAnnotation = selectedAnnotation
         self.selectedAnnotationType = AnnotationType.Selected
         self.selectedAnnotation.drawBoundingBox = True
+        self.selectedAnnotator.MarkDirty()
         pass
 
     def annotationHandler(self, appPos):
         if self.selectedAnnotation is None:
             return
+        if not self.selectedAnnotation.PERSISTENT:
+            self.journalAnnotation("annotation_add", self.selectedAnnotation)
         self.selectedAnnotation.PERSISTENT = True
         selectedAnnotation = self.selectedAnnotation
         self.on_action_triggered(None)
         self.selectedAnnotation = selectedAnnotation
         self.selectedAnnotationType = AnnotationType.Selected
         self.selectedAnnotation.drawBoundingBox = True
+        self.selectedAnnotator.MarkDirty()
 
     def previewAnnotation(self, appPos):
         self.lastAppPos = appPos
@@ -843,6 +1140,7 @@ class TutorialGUI(qt.QMainWindow):
                                       _helperPos[1] - self.selectedAnnotation.target["position"][1]]
 
             self.selectedAnnotation.setValuesOffset(*offsetFromTargetWidget)
+            self.selectedAnnotator.MarkDirty()
 
         if self.selectedAnnotationType == AnnotationType.Selected:
             self.OptHelperWidget.SetActive(self.selectedAnnotation.wantsOptHelper())
@@ -891,10 +1189,12 @@ class TutorialGUI(qt.QMainWindow):
         pass
 
     def refreshViews(self):
-        if self.selectedAnnotator is None:
+        # Only the slides changed since the last refresh are drawn again
+        if self.selectedAnnotator is None or not self.selectedAnnotator.NeedsRedraw():
             return
         self.selectedAnnotator.ReDraw()
         self.selectedSlide.setPixmap(self.selectedAnnotator.GetResized(*self.selectedSlideSize, keepAspectRatio=True))
+        self.journalSelectedAnnotation()
         pass
 
     def mouse_move_event(self, event):
@@ -933,6 +1233,7 @@ class TutorialGUI(qt.QMainWindow):
 
         if self.selectedAnnotationType == AnnotationType.Selected:
             if event.key() == qt.Qt.Key_Delete:
+                self.journalAnnotation("annotation_remove", self.selectedAnnotation)
                 self.selectedAnnotation.PERSISTENT = False
                 self.cancelCurrentAnnotation()
 
@@ -956,6 +1257,7 @@ class TutorialGUI(qt.QMainWindow):
                 else:
                     self.selectedAnnotation.text += event.text()
 
+                self.selectedAnnotator.MarkDirty()
             return True
 
         elif self.selectedAnnotator is not None and self.selectedAnnotation is not None:
@@ -984,6 +1286,8 @@ class TutorialGUI(qt.QMainWindow):
             self.selectorParentDelta(1)
 
     def open_json_file(self, filepath):
+        self.cancelLoading()
+        SlideImageCache.clear()
         directory_path = os.path.dirname(filepath)
         with open(filepath, encoding='utf-8') as file:
             rawTutorialData = json.load(file)
@@ -1015,6 +1319,7 @@ class TutorialGUI(qt.QMainWindow):
             tutorial.steps.append(screenshotList)
         self.loadImagesAndMetadata(tutorial)
         self.tutorial2 = tutorial
+        self.restoreJournal(filepath)
         
         new_image_path = self.dir_path+'/../Resources/NewSlide/white.png'
         new_screenshot = TutorialScreenshot(new_image_path, "")
@@ -1028,6 +1333,13 @@ class TutorialGUI(qt.QMainWindow):
 
 
 
+    def closeEvent(self, event):
+        # The edits still queued are written, the journal is started again by opening a tutorial
+        self.journal.close()
+        self.cancelLoading()
+        SlideImageCache.clear()
+        event.accept()
+
     def eventFilter(self, obj, event):
         if obj == self.selectedSlide:
             if event.type() == qt.QEvent.Leave:
@@ -1562,6 +1874,8 @@ class TutorialGUI(qt.QMainWindow):
         self.slideBodyWidget.setText(self.tutorialInfo.get("desc", ""))
         self.slideTitleWidget.textEdited.connect(self._onCoverTitleEdited)
         self.slideBodyWidget.textChanged.connect(self._onCoverDescChanged)
+        # Disconnected with the rest above
+        self.slideBodyWidget.textChanged.connect(self.slideTextChanged)
         self._bindsCover = True
 
     def _unbindEditorsFromCover(self):
@@ -1594,6 +1908,8 @@ class TutorialGUI(qt.QMainWindow):
         # Keep title enabled to avoid UI inconsistency, but text changes won't be used.
         self.slideBodyWidget.setText(self.tutorialInfo.get("acknowledgments", ""))
         self.slideBodyWidget.textChanged.connect(self._onAckTextChanged)
+        # Disconnected with the rest above
+        self.slideBodyWidget.textChanged.connect(self.slideTextChanged)
         self._bindsAck = True
 
     def _unbindEditorsFromAcknowledgment(self):
@@ -6,6 +6,7 @@ import json
 from slicer.i18n import tr as _
 from Lib.Annotations import Annotation, AnnotationType, AnnotatorSlide, AnnotatedTutorial
 from Lib.TutorialUtils import Tutorial, TutorialScreenshot
+from Lib.WidgetMetadata import CompactWidgetMetadata
 import Lib.TutorialUtils as TutorialUtils
 import Lib.TutorialExporter as Exporter
 
@@ -624,7 +625,7 @@ class ImageDrawer:
                 image_drawer.load_image(screenshot)
                 image_drawer.painter(OutputAnnotator[annotateSteps], screenshotData, 'es')
 
-                image_drawer.save_to_png(TutorialUtils.get_module_basepath("TutorialMaker") + '/Outputs/Translation/output_image_' + str(i) + '.png')
+                image_drawer.save_to_png(TutorialUtils.get_output_path() + '/Translation/output_image_' + str(i) + '.png')
 
                 imgSS = imgSS + 1
             pass
@@ -717,7 +718,9 @@ class TutorialPainter:
         self.currentLanguage = settings.value("language")
 
         # TODO: Get a better way to get the module location
-        self.outputFolder = f"{os.path.dirname(__file__)}/../Outputs"
+        self.outputFolder = TutorialUtils.get_output_path()
+        # Raw/ captures and Annotations/ of the tutorial being rendered
+        self.inputFolder = self.outputFolder
         pass
 
     def LoadAnnotatedTutorial(self, path):
@@ -751,7 +754,7 @@ class TutorialPainter:
                     slideMetadata = []
                     test_contents = os.listdir(stepPath)
                     for content in test_contents:
-                        if(".json" not in content):
+                        if(".json" not in content and CompactWidgetMetadata.extension not in content):
                             continue
                         tsParser.metadata = f"{stepPath}/{content}"
                         slideMetadata.extend(tsParser.getWidgets())
@@ -762,14 +765,14 @@ class TutorialPainter:
                 slideImage = qt.QImage(f"{self.outputFolder}/Annotations/{slideData['ImagePath']}")
             
             annotations = []
+            widgetsByPath = AnnotatorSlide.IndexWidgetsByPath(slideMetadata)
             for annotationData in slideData["Annotations"]:
-                targetWidget = {
-                    "position": [0,0],
-                    "size": [1,1]
-                }
-                for widget in slideMetadata:
-                    if annotationData["widgetPath"] == widget["path"]:
-                        targetWidget = widget
+                targetWidget = widgetsByPath.get(annotationData["widgetPath"])
+                if targetWidget is None:
+                    targetWidget = {
+                        "position": [0,0],
+                        "size": [1,1]
+                    }
                 annotation = Annotation(
                     targetWidget,
                     *annotationData["offset"],
@@ -793,27 +796,90 @@ class TutorialPainter:
             self.slides.append(annotatedSlide)
         pass
 
-    def SaveLocalizedScreenshots(self, path):
-        if not os.path.exists(path):
-            os.mkdir(path)
-        for slideIndex, slide in enumerate(self.slides):
-            slide.Draw()
-            slideImage = slide.outputImage
-            slideImage.save(f"{path}/{self.imagePaths[slideIndex]}")
+    def GenerateHTMLfromAnnotatedTutorial(self, path):
+        self.GenerateLocalizedTutorials(path, {self.currentLanguage: None})
         pass
 
-    def GenerateHTMLfromAnnotatedTutorial(self, path):
-        [self.TutorialInfo, self.slides, self.imagePaths] = AnnotatedTutorial.LoadAnnotatedTutorial(path)
-        localizedScreenshotsPath = f"{self.outputFolder}/{self.TutorialInfo['title']}_{self.currentLanguage}"
+    def GenerateLocalizedTutorials(self, path, textDicts : dict, outputFolder : str = None, maxWorkers : int = None, embedImages : dict = None,
+                                   inputFolder : str = None):
+        """Write the localized screenshots, HTML and Markdown of an annotated tutorial for several languages.
+
+        textDicts maps every language to its text dictionary, None reads Annotations/text_dict_<language>.json
+        (or the default dictionary). The slides, images and metadata are loaded once and shared by all the
+        languages, the screenshots are drawn and written by a pool of worker threads.
+        embedImages are the Exporter.InlineImages options to embed the screenshots in the HTML, None reads
+        them from the settings. inputFolder holds the Raw/ captures and the Annotations/ folder of the
+        tutorial, the Outputs folder by default.
+        Returns the output folder of every language.
+        """
+        if embedImages is None:
+            embedImages = TutorialPainter.GetEmbeddedImageOptions()
+        self.inputFolder = inputFolder if inputFolder is not None else self.outputFolder
+        [self.TutorialInfo, self.slides, self.imagePaths] = AnnotatedTutorial.LoadAnnotatedTutorial(path, self.inputFolder)
+        if outputFolder is None:
+            outputFolder = TutorialUtils.get_output_path()
         clean_title = self.TutorialInfo["title"].strip().replace(" ", "_").replace("\t", "_").replace("\n", "_").replace("\r", "_")
-        clean_folder = f"{os.path.dirname(os.path.dirname(__file__))}/Outputs"
-        localizedScreenshotsPath = f"{clean_folder}/{clean_title}_{self.currentLanguage}"
-        self.SaveLocalizedScreenshots(localizedScreenshotsPath)
 
+        # Decoded once, the workers only read them
+        backgrounds = [slide.image.toImage() for slide in self.slides]
+
+        writer = TutorialUtils.ScreenshotWriter(maxWorkers)
+        outputPaths = {}
+        tutorials = []
+        try:
+            for language, textDict in textDicts.items():
+                if textDict is None:
+                    textDict = self.GetTranslatedDict(language)
+                localizedScreenshotsPath = f"{outputFolder}/{clean_title}_{language}"
+                os.makedirs(localizedScreenshotsPath, exist_ok=True)
+
+                slideTexts = []
+                for slideIndex, slide in enumerate(self.slides):
+                    slideTexts.append([textDict.get(slide.SlideTitleKey, slide.SlideTitle),
+                                       textDict.get(slide.SlideBodyKey, slide.SlideBody)])
+                    annotations = [annotation.withText(textDict.get(annotation.textKey, annotation.text)) for annotation in slide.annotations]
+                    writer.submit(TutorialPainter.DrawLocalizedScreenshot,
+                                  backgrounds[slideIndex],
+                                  annotations,
+                                  f"{localizedScreenshotsPath}/{self.imagePaths[slideIndex]}")
+
+                tutorials.append([localizedScreenshotsPath, slideTexts])
+                outputPaths[language] = localizedScreenshotsPath
+            # The embedded images are read back from the written screenshots
+            writer.flush()
+            for [localizedScreenshotsPath, slideTexts] in tutorials:
+                images = None
+                if embedImages is not None:
+                    images = Exporter.InlineImages(localizedScreenshotsPath, **embedImages)
+                self.WriteLocalizedTutorial(f"{localizedScreenshotsPath}/{clean_title}", slideTexts, images)
+        finally:
+            writer.shutdown()
+        return outputPaths
+
+    @staticmethod
+    def DrawLocalizedScreenshot(background : qt.QImage, annotations : list[Annotation], filename : str):
+        # Runs on the worker threads, everything is drawn on a QImage
+        image = background.copy()
+        AnnotatorSlide.DrawAnnotations(image, annotations)
+        if not image.save(filename):
+            raise OSError(f"Could not write {filename}")
+
+    @staticmethod
+    def GetEmbeddedImageOptions():
+        """Exporter.InlineImages options from the settings, None when the HTML links to the screenshot files"""
+        settings = slicer.app.userSettings()
+        if str(settings.value("TutorialMaker/EmbedImages", "false")).lower() not in ("true", "1"):
+            return None
+        return {"width": int(settings.value("TutorialMaker/EmbeddedImageWidth", 1280)),
+                "format": str(settings.value("TutorialMaker/EmbeddedImageFormat", "webp")),
+                "quality": int(settings.value("TutorialMaker/EmbeddedImageQuality", 80))}
+
+    def WriteLocalizedTutorial(self, tutorialPath, slideTexts, images : Exporter.InlineImages = None):
         # If we are going to have a exporter lib then it should handle this itself
         pages : list[Exporter.SlidePage] = []
         for slideIndex, slide in enumerate(self.slides):
             page = None
+            [slideTitle, slideBody] = slideTexts[slideIndex]
             
             if slide.SlideLayout == "CoverPage":
                 page = Exporter.CoverSlide(
@@ -825,39 +891,44 @@ class TutorialPainter:
             # This doesn't parse the Acknowledgements correctly
             elif slide.SlideLayout == "Acknowledgment":
                 page = Exporter.BackCoverSlide(
-                    slide.SlideTitle or "Acknowledgments",
-                    slide.SlideBody 
+                    slideTitle or "Acknowledgments",
+                    slideBody 
                 )
 
 
             elif slide.SlideLayout == "Screenshot" or slide.SlideLayout == "Copy":
-                title = slide.SlideTitle 
                 page = Exporter.SimpleSlide(
-                    slide.SlideTitle,
-                    slide.SlideBody,
+                    slideTitle,
+                    slideBody,
                     self.imagePaths[slideIndex]
                 )
             else:
                 continue
             pass
             pages.append(Exporter.SlidePage(page))
-        
-        tutorialPath = localizedScreenshotsPath + f"/{clean_title}"
 
         export = Exporter.TutorialExporter(pages, self.TutorialInfo["title"])
-        html = export.ToHtml()
+        html = export.ToHtml(images)
         markdown = export.ToMarkdown()
 
-        with open(tutorialPath + ".html", "w") as fd:
+        with open(tutorialPath + ".html", "w", encoding="utf-8") as fd:
             fd.write(html)
 
-        with open(tutorialPath + ".md", "w") as fd:
+        with open(tutorialPath + ".md", "w", encoding="utf-8") as fd:
             fd.write(markdown)
             
         pass
 
+    def GetTranslatedDict(self, lang):
+        """Text dictionary of a language, Annotations/text_dict_<lang>.json or the default one"""
+        dictPath = self.inputFolder + f"/Annotations/text_dict_{lang}.json"
+        if not os.path.exists(dictPath):
+            return self.GetLocalizedDict(lang)
+        with open(dictPath, encoding='utf-8') as file:
+            return json.load(file)
+
     def GetLocalizedDict(self, lang, tutorialName = ""):
-        dictPath = self.outputFolder + "/Annotations/text_dict_default.json"
+        dictPath = self.inputFolder + "/Annotations/text_dict_default.json"
         textDict = {}
         with open(dictPath, encoding='utf-8') as file:
                 textDict = json.load(file)
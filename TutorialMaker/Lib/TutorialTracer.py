@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import threading
+
+class TraceSpan():
+    """A running span, ended by end() or by leaving its with block. set() adds arguments shown in the trace"""
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.perf_counter()
+
+    def set(self, **args):
+        self.args.update(args)
+        return self
+
+    def end(self):
+        Tracer.addComplete(self.name, self.category, self.start, time.perf_counter(), self.args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is not None and excType is not StopIteration:
+            self.args["error"] = excType.__name__
+        self.end()
+        return False
+
+class NullSpan():
+    """Returned while tracing is disabled, does nothing"""
+    def set(self, **args):
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+class Tracer():
+    """Records a timeline of the captures in the Chrome trace-event format.
+
+    Open the written file in chrome://tracing or https://ui.perfetto.dev. Tracing is enabled by the
+    TUTORIALMAKER_TRACE environment variable or the TutorialMaker/Trace setting. While it is disabled
+    span() returns a shared NullSpan and counter() returns at once, the instrumented code only pays
+    for the call.
+
+        with Tracer.span("walk", window=0) as span:
+            data = getAllWidgetsData(window)
+            span.set(widgets=len(data))
+    """
+    enabled = False
+    __nullSpan = NullSpan()
+    __events = []
+    __threads = {}
+    __lock = threading.Lock()
+    __origin = time.perf_counter()
+
+    @staticmethod
+    def configure(enabled=None):
+        """Enable tracing from the environment and settings, or as given"""
+        if enabled is None:
+            enabled = os.environ.get("TUTORIALMAKER_TRACE", "").lower() in ("1", "true", "yes")
+            if not enabled:
+                try:
+                    import slicer
+                    enabled = str(slicer.app.userSettings().value("TutorialMaker/Trace", "false")).lower() in ("true", "1")
+                except Exception:
+                    enabled = False
+        Tracer.enabled = enabled
+        return enabled
+
+    @staticmethod
+    def span(name, category="capture", **args):
+        if not Tracer.enabled:
+            return Tracer.__nullSpan
+        return TraceSpan(name, category, args)
+
+    @staticmethod
+    def counter(name, **values):
+        if not Tracer.enabled:
+            return
+        Tracer.__add({"name": name, "ph": "C", "ts": Tracer.__timestamp(time.perf_counter()), "args": values})
+
+    @staticmethod
+    def instant(name, category="capture", **args):
+        if not Tracer.enabled:
+            return
+        Tracer.__add({"name": name, "cat": category, "ph": "i", "s": "t", "ts": Tracer.__timestamp(time.perf_counter()), "args": args})
+
+    @staticmethod
+    def addComplete(name, category, start, end, args):
+        Tracer.__add({"name": name, "cat": category, "ph": "X",
+                      "ts": Tracer.__timestamp(start), "dur": round((end - start) * 1e6, 1), "args": args})
+
+    @staticmethod
+    def write(path):
+        """Write the events recorded since the last write, nothing is written when there are none"""
+        with Tracer.__lock:
+            [events, Tracer.__events] = [Tracer.__events, []]
+            threads = dict(Tracer.__threads)
+        if len(events) == 0:
+            return None
+        pid = os.getpid()
+        metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": threadName}}
+                    for tid, threadName in threads.items()]
+        with open(path, "w", encoding="utf-8") as fd:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, fd, ensure_ascii=False)
+        return path
+
+    @staticmethod
+    def clear():
+        with Tracer.__lock:
+            Tracer.__events = []
+
+    @staticmethod
+    def __timestamp(value):
+        return round((value - Tracer.__origin) * 1e6, 1)
+
+    @staticmethod
+    def __add(event):
+        thread = threading.current_thread()
+        event["pid"] = os.getpid()
+        event["tid"] = thread.ident
+        with Tracer.__lock:
+            Tracer.__threads[thread.ident] = thread.name
+            Tracer.__events.append(event)
@@ -2,7 +2,17 @@ import slicer
 import qt
 import os
 import re
+import json
+import shutil
+import hashlib
+import inspect
+import logging
+import functools
+import threading
+from collections import OrderedDict
 from slicer.i18n import tr as _
+from Lib.WidgetMetadata import CompactWidgetMetadata
+from Lib.TutorialTracer import Tracer
 
 def get_module_basepath(moduleName):
     try:
@@ -10,7 +20,24 @@ def get_module_basepath(moduleName):
     except Exception:
         raise Exception(f"Module {moduleName} not found")
 
+def get_output_path():
+    """Folder of the captures and annotations, TUTORIALMAKER_OUTPUT_DIR when set (each capture worker has its own)"""
+    outputPath = os.environ.get("TUTORIALMAKER_OUTPUT_DIR", "")
+    if outputPath != "":
+        return os.path.abspath(outputPath)
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/Outputs"
+
+def is_interactive():
+    """False in the capture workers (TUTORIALMAKER_NON_INTERACTIVE) and on the offscreen Qt platform, nobody can answer a dialog there"""
+    if os.environ.get("TUTORIALMAKER_NON_INTERACTIVE", "").lower() in ("1", "true", "yes"):
+        return False
+    return os.environ.get("QT_QPA_PLATFORM", "") not in ("offscreen", "minimal")
+
 class Widget():
+    # Virtual children (list items, tree view nodes and menu actions) of the widgets already
+    # expanded during the current capture, None when no capture is running
+    _virtualChildrenCache = None
+
     def __init__(self, widgetData) -> None:
         self.__widgetData = widgetData
         self.name = widgetData.name
@@ -73,13 +100,36 @@ class Widget():
             return children
         for child in self.__widgetData.children():
             children.append(Widget(child))
+        children.extend(self.__virtualChildren())
+        return children
+
+    def __virtualChildren(self):
+        cache = Widget._virtualChildrenCache
+        if cache is not None:
+            # Keyed by the wrapped object, the object is kept in the entry so its id can't be reused
+            cached = cache.get(id(self.__widgetData))
+            if cached is not None and cached[0] is self.__widgetData:
+                return cached[1]
         if self.className == "QListWidget":
-            children.extend(self.__listWidgetAsChildren())
+            virtualChildren = self.__listWidgetAsChildren()
         elif self.className == "qMRMLSubjectHierarchyTreeView":
-            children.extend(self.__MRMLTreeViewAsChildren())
+            virtualChildren = self.__MRMLTreeViewAsChildren()
         elif self.className == "qSlicerModulesMenu" or self.className == "QMenu":
-            children.extend(self.__QMenuActionAsChildren())
-        return children
+            virtualChildren = self.__QMenuActionAsChildren()
+        else:
+            virtualChildren = []
+        if cache is not None:
+            cache[id(self.__widgetData)] = (self.__widgetData, virtualChildren)
+        return virtualChildren
+
+    @staticmethod
+    def beginCapture():
+        """Memoize the virtual children until endCapture, the widgets can't change during a capture"""
+        Widget._virtualChildrenCache = {}
+
+    @staticmethod
+    def endCapture():
+        Widget._virtualChildrenCache = None
 
     def childrenDetails(self):
         children = self.getChildren()
@@ -92,17 +142,22 @@ class Widget():
         #slicer.app.processEvents(qt.QEventLoop.AllEvents, 70)
         return result
 
-    def getGlobalPos(self):
-        mw = slicer.util.mainWindow()
-        windowPos = mw.mapToGlobal(mw.rect.topLeft())
+    def getGlobalPos(self, windowPos=None, devicePixelRatio=None):
+        if windowPos is None:
+            mw = slicer.util.mainWindow()
+            windowPos = mw.mapToGlobal(mw.rect.topLeft())
+        if devicePixelRatio is None:
+            devicePixelRatio = slicer.app.desktop().devicePixelRatioF()
 
         globalPosTopLeft = self.__widgetData.mapToGlobal(self.__widgetData.rect.topLeft())
-        return [(globalPosTopLeft.x() - windowPos.x())*slicer.app.desktop().devicePixelRatioF(), (globalPosTopLeft.y() - windowPos.y())*slicer.app.desktop().devicePixelRatioF()]
+        return [(globalPosTopLeft.x() - windowPos.x())*devicePixelRatio, (globalPosTopLeft.y() - windowPos.y())*devicePixelRatio]
 
-    def getSize(self):
+    def getSize(self, devicePixelRatio=None):
+        if devicePixelRatio is None:
+            devicePixelRatio = slicer.app.desktop().devicePixelRatioF()
         posTopLeft = self.__widgetData.rect.topLeft()
         posBotRight = self.__widgetData.rect.bottomRight()
-        return [(posBotRight.x() - posTopLeft.x())*slicer.app.desktop().devicePixelRatioF(), (posBotRight.y() - posTopLeft.y())*slicer.app.desktop().devicePixelRatioF()]
+        return [(posBotRight.x() - posTopLeft.x())*devicePixelRatio, (posBotRight.y() - posTopLeft.y())*devicePixelRatio]
 
     def __listWidgetAsChildren(self):
         from types import SimpleNamespace
@@ -245,9 +300,39 @@ class Util():
                 #print("Not expanding :" +child.className)
                 continue
             widgets.append(child)
-            widgets = widgets + Util.__getWidgetsRecursive(child, depth + 1)
+            widgets.extend(Util.__getWidgetsRecursive(child, depth + 1))
+        return widgets
+
+    @staticmethod
+    def getOnScreenWidgetsWithPaths(window):
+        """Single pass version of getOnScreenWidgets + uniqueWidgetPath.
+
+        Returns [widget, path] pairs in the same order as getOnScreenWidgets, the path of every
+        widget is built from the path of its parent instead of walking back up to the root.
+        """
+        if Util.mw is None:
+            Util.loadMainWindow()
+        window = Widget(window)
+        widgets = []
+        Util.__getWidgetsWithPathsRecursive(window, Util.uniqueWidgetPath(window), widgets)
         return widgets
 
+    @staticmethod
+    def __getWidgetsWithPathsRecursive(widget, widgetPath, widgets):
+        classCount = {}
+        for child in widget.getChildren():
+            # Same naming as __classtoname: index among the siblings sharing the class name
+            classIndex = classCount.get(child.className, 0)
+            classCount[child.className] = classIndex + 1
+            if hasattr(child.inner(), "isWindow") and child.inner().isWindow():
+                continue
+            if child.name != "":
+                childPath = widgetPath + "/" + child.name
+            else:
+                childPath = widgetPath + "/" + child.className + ":" + str(classIndex)
+            widgets.append([child, childPath])
+            Util.__getWidgetsWithPathsRecursive(child, childPath, widgets)
+
     @staticmethod
     def getNamedWidget(path, widget=None):
         if Util.mw is None:
@@ -352,9 +437,9 @@ class Util():
     def verifyOutputFolders():
         if Util.mw is None:
             Util.loadMainWindow()
-        basePath = get_module_basepath("TutorialMaker") + "/Outputs/"
+        basePath = get_output_path() + "/"
         if not os.path.exists(basePath):
-            os.mkdir(basePath)
+            os.makedirs(basePath)
             os.mkdir(basePath + "Raw")
             os.mkdir(basePath + "Annotations")
             os.mkdir(basePath + "Translation")
@@ -372,6 +457,30 @@ class Util():
         result=(value-inputMin)/(inputMax-inputMin)*(outputMax-outputMin)+outputMin
         return result
 
+    @staticmethod
+    def writeFileAtomic(path, writeFile):
+        """writeFile(tempPath) writes a temporary file next to path, moved over path once complete.
+        A failed or interrupted write leaves the previous file untouched."""
+        tempPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            writeFile(tempPath)
+            os.replace(tempPath, path)
+        finally:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+    @staticmethod
+    def writeJSONAtomic(data, path):
+        # TutorialMaker/CompactJSON writes the files without indentation, smaller and faster to write
+        compact = str(slicer.app.userSettings().value("TutorialMaker/CompactJSON", "false")).lower() in ("true", "1")
+        def writeFile(tempPath):
+            with open(tempPath, "w", encoding="utf-8") as fd:
+                if compact:
+                    json.dump(data, fd, ensure_ascii=False, separators=(",", ":"))
+                else:
+                    json.dump(data, fd, ensure_ascii=False, indent=4)
+        Util.writeFileAtomic(path, writeFile)
+
 class WidgetFinder(qt.QWidget):
     def __init__(self, parent=None):
         super().__init__(None)
@@ -511,163 +620,233 @@ class SelfTestTutorialLayer():
         "takeScreenshot" : "SCREENSHOT",
     }
 
-    @staticmethod
-    def ParseTutorial(path):
-        if path == "" or path == None:
-            raise Exception()
-
-        counter = NextCounter()
-
-        code_contents = ""
-        with open(path, encoding='utf-8') as fd:
-            code_contents = fd.read()
-
-        # GENERATE FUNCTIONS FOR EACH TUTORIAL DIRECTIVE
-        _tutorialBeginString = f"# {SelfTestTutorialLayer.directives['id']} {SelfTestTutorialLayer.directives['begin']}"
-        _tutorialEndString = f"# {SelfTestTutorialLayer.directives['id']} {SelfTestTutorialLayer.directives['end']}"
-        _tutorialTakeScreenshot = f"# {SelfTestTutorialLayer.directives['id']} {SelfTestTutorialLayer.directives['takeScreenshot']}"
-
-        tutorialMatcher = rf"(?s)(?<={_tutorialBeginString}).*?(?={_tutorialEndString})"
-        functionMatcher = rf"(?s).+?(?={_tutorialTakeScreenshot})"
-        infoMatcher = rf"(?m)(?<=# {SelfTestTutorialLayer.directives['id']} {SelfTestTutorialLayer.directives['metadata']} )([A-z]+)( )(.*)\n"
-
-        tutorial_tests = []
-        for test_module in re.findall(tutorialMatcher, code_contents):
-            tutorial_title = ""
-            tutorial_author = ""
-            tutorial_date = ""
-            tutorial_desc = ""
-            tutorial_dependencies = ""
-
-            for info in re.findall(infoMatcher, test_module):
-                if info[0] == SelfTestTutorialLayer.directives['metadata_title']:
-                    tutorial_title = info[2]
-                    pass
-                elif info[0] == SelfTestTutorialLayer.directives['metadata_author']:
-                    tutorial_author = info[2]
-                    pass
-                elif info[0] == SelfTestTutorialLayer.directives['metadata_date']:
-                    tutorial_date = info[2]
-                    pass
-                elif info[0] == SelfTestTutorialLayer.directives['metadata_desc']:
-                    tutorial_desc = info[2]
-                    pass
-                elif info[0] == SelfTestTutorialLayer.directives['metadata_dependencies']:
-                    tutorial_dependencies = info[2]
-                    pass
-
-            info_func = (
-                "\n"
-                f"{' '*8}def TUTORIAL_GETINFO():\n"
-                f"{' '*12}return ['{tutorial_title}','{tutorial_author}', '{tutorial_date}', '{tutorial_desc}', '{tutorial_dependencies}']\n"
-            )
-            
-            tutorial_functions = []
-            for idx, test_function in enumerate(re.findall(functionMatcher, test_module)):
-                _functionSignature = f"def TUTORIAL_SCREENSHOT_{idx}(_locals):\n"
-                lines = test_function.split("\n")
-                _indentation = lines[0].count(" ") # THIS DOESN'T WORK
-                _indentation = 8 #TODO: NEED TO FIND A FAST WAY TO GET THIS DINAMICALLY
-                lines[0] = ""
-                _newFunction = "\n" + " "*_indentation + _functionSignature
-                _newFunction += " "*(_indentation + 4) + "globals().update(_locals)\n"
-
-                for line in lines:
-                    _newFunction += " "*4 + line + "\n"
-                
-                _newFunction += " "*(_indentation + 4) + "_locals.update(locals())\n"
-
-                tutorial_functions.append(_newFunction)
-                pass
-            tutorial_functions[0] = info_func + tutorial_functions[0]
-            tutorial_functions[len(tutorial_functions) - 1] = tutorial_functions[len(tutorial_functions) - 1] + f"{' '*8}return locals()\n"
-            counter.count = 0
-            tutorial_tests.append(re.sub(functionMatcher, lambda match : tutorial_functions[counter.next()], test_module))
-        counter.count = 0
-        finalFile = re.sub(tutorialMatcher, lambda match : tutorial_tests[counter.next()], code_contents)
-
-        path = get_module_basepath("TutorialMaker") + "/Outputs/"
-
-        with open(path + "CurrentParsedTutorial.py", "w", encoding='utf-8') as fd:
-            fd.write(finalFile)
-        pass
+    # Bumped when the generated code changes, the cached parses of the old parser are then ignored
+    parserVersion = 2
+    # Hash of the tutorial source -> compiled parsed code, for the repeated captures of one session
+    __compiledTutorials = {}
 
     @staticmethod
-    def RunTutorial(tutorialClass, callback = None):
-        import inspect
-        import functools
-        TUTORIAL_STEP_INTERVAL = 3000
-        TUTORIAL_STEP_DICT = {
-            -1: True,
-            "FINISHED": False
-        }
+    def LoadTutorialModule(path):
+        """Parse, compile and run a tutorial file in a module of its own, returned.
+
+        The parsed code and its bytecode are cached in Outputs/ParsedTutorials, keyed by a hash of the
+        tutorial source, a tutorial is only parsed again when it changed. Every tutorial gets its own
+        module, so several of them can be loaded at the same time.
+        """
+        import sys
+        import types
+        import marshal
+        import importlib.util
+
+        if not path:
+            raise ValueError("No tutorial file given")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Tutorial file not found: {path}")
+        with open(path, "rb") as fd:
+            source = fd.read()
+        tutorialName = re.sub(r"\W", "_", os.path.splitext(os.path.basename(path))[0])
+        digest = hashlib.sha256(source)
+        digest.update(f"{SelfTestTutorialLayer.parserVersion}".encode("utf-8"))
+        key = digest.hexdigest()[:16]
+
+        cacheFolder = get_output_path() + "/ParsedTutorials"
+        parsedPath = f"{cacheFolder}/{tutorialName}_{key}.py"
+        bytecodePath = f"{cacheFolder}/{tutorialName}_{key}.bin"
+
+        code = SelfTestTutorialLayer.__compiledTutorials.get(key)
+        if code is None and os.path.exists(parsedPath) and os.path.exists(bytecodePath):
+            try:
+                with open(bytecodePath, "rb") as fd:
+                    bytecode = fd.read()
+                if bytecode.startswith(importlib.util.MAGIC_NUMBER):
+                    code = marshal.loads(bytecode[len(importlib.util.MAGIC_NUMBER):])
+            except Exception:
+                logging.exception(f"Could not read the cached tutorial {bytecodePath}")
+                code = None
+        if code is None:
+            parsedSource = SelfTestTutorialLayer.ParseTutorialSource(source.decode("utf-8"))
+            # The code is compiled against the written file, inspect reads the tutorial source from it
+            code = compile(parsedSource, parsedPath, "exec")
+            os.makedirs(cacheFolder, exist_ok=True)
+            # Only the older parses of this tutorial, not those of tutorials named with it as a prefix
+            for cached in os.listdir(cacheFolder):
+                if re.fullmatch(rf"{re.escape(tutorialName)}_[0-9a-f]{{16}}\.(py|bin)", cached) and not cached.startswith(f"{tutorialName}_{key}."):
+                    os.remove(f"{cacheFolder}/{cached}")
+            def writeParsed(tempPath):
+                with open(tempPath, "w", encoding="utf-8") as fd:
+                    fd.write(parsedSource)
+            def writeBytecode(tempPath):
+                with open(tempPath, "wb") as fd:
+                    fd.write(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+            Util.writeFileAtomic(parsedPath, writeParsed)
+            Util.writeFileAtomic(bytecodePath, writeBytecode)
+        SelfTestTutorialLayer.__compiledTutorials[key] = code
+
+        # A new module on every load, like importing the parsed file again
+        moduleName = f"TutorialMakerParsedTutorials.{tutorialName}_{key}"
+        module = types.ModuleType(moduleName)
+        module.__file__ = parsedPath
+        sys.modules[moduleName] = module
+        try:
+            exec(code, module.__dict__)
+        except Exception:
+            del sys.modules[moduleName]
+            raise
+        return module
 
-        def ScreenshotCallable(tutorial, callback, _locals, _stepdict, _index=0):
-            if not _stepdict[_index - 1]:
-                timerCallback = functools.partial(ScreenshotCallable, tutorial, callback, _locals, _stepdict, _index=_index)
-                qt.QTimer.singleShot(TUTORIAL_STEP_INTERVAL, timerCallback)
-                return
-            if _index > 0:
-                tutorial.nextScreenshot()
-            callback(_locals)
-            _stepdict[_index] = True
-
-        def ScreenshotCallableLast(tutorial, _index=0):
-            if not TUTORIAL_STEP_DICT[_index - 1]:
-                endCallback = functools.partial(ScreenshotCallableLast, tutorial, _index)
-                qt.QTimer.singleShot(TUTORIAL_STEP_INTERVAL, endCallback)
-                return
-            tutorial.nextScreenshot()
-            tutorial.endTutorial()
-            TUTORIAL_STEP_DICT["FINISHED"] = True
+    @staticmethod
+    def ParseTutorialSource(code_contents):
+        """The code of a tutorial with its directives turned into yield statements, line for line.
+
+        The test function becomes a generator run by RunTutorial: BEGIN yields the tutorial
+        information, every SCREENSHOT yields to take the screenshot and END returns. The steps
+        run in the frame of the test function, no code is moved.
+        """
+        _id = SelfTestTutorialLayer.directives['id']
+        blockMatcher = rf"(?ms)^([ \t]*)# {_id} {SelfTestTutorialLayer.directives['begin']}[^\n]*$(.*?)^[ \t]*# {_id} {SelfTestTutorialLayer.directives['end']}[^\n]*$"
+        screenshotMatcher = rf"(?m)^([ \t]*)# {_id} {SelfTestTutorialLayer.directives['takeScreenshot']}[^\n]*$"
+        infoMatcher = rf"(?m)(?<=# {_id} {SelfTestTutorialLayer.directives['metadata']} )([A-z]+)( )(.*)\n"
+
+        infoFields = ["metadata_title", "metadata_author", "metadata_date", "metadata_desc", "metadata_dependencies"]
+        def parseBlock(match):
+            indentation = match.group(1)
+            block = match.group(2)
+            tutorialInfo = {SelfTestTutorialLayer.directives[field]: "" for field in infoFields}
+            for info in re.findall(infoMatcher, block):
+                if info[0] in tutorialInfo:
+                    tutorialInfo[info[0]] = info[2]
+            block = re.sub(screenshotMatcher, lambda screenshot: f"{screenshot.group(1)}yield", block)
+            return f"{indentation}yield {list(tutorialInfo.values())!r}{block}{indentation}return"
+
+        return re.sub(blockMatcher, parseBlock, code_contents)
 
+    @staticmethod
+    def RunTutorial(tutorialClass, callback = None, settleTime = None, language = None):
+        # Timeline of the capture, written next to Tutorial.json when enabled
+        Tracer.configure()
+        scheduler = TutorialStepScheduler(settleTime=settleTime, callback=callback)
         tutorialSource = inspect.getsource(tutorialClass.runTest)
         funcMatcher = rf"(?m)(?<=self\.).+(?=\()"
-        functionIndex = 0
         for funcName in re.findall(funcMatcher, tutorialSource):
             func = getattr(tutorialClass, funcName)
-            _locals = func()
-            if _locals is None:
-                continue
-            if not type(_locals) == dict:
+            # Runs the test until its BEGIN directive, which yields the tutorial information
+            with Tracer.span("tutorial setup", function=funcName):
+                steps = func()
+                info = next(steps, None) if inspect.isgenerator(steps) else None
+            if info is None:
                 continue
-            if _locals["TUTORIAL_GETINFO"] is not None:
-                info = _locals["TUTORIAL_GETINFO"]()
-                tutorial = Tutorial(*info)
-                tutorial.verifyDependencies()
-                tutorial.clearTutorial()
-                tutorial.beginTutorial()
-                _stepIndex = 0
-                while True:
-                    TUTORIAL_STEP_DICT[functionIndex] = False
-                    try:
-                        timerCallback = functools.partial(ScreenshotCallable, tutorial, _locals[f"TUTORIAL_SCREENSHOT_{functionIndex}"], _locals, TUTORIAL_STEP_DICT, _index=_stepIndex)
-                        qt.QTimer.singleShot(TUTORIAL_STEP_INTERVAL*functionIndex, timerCallback)
-                        functionIndex += 1
-                        _stepIndex += 1
-                    except Exception as e:
-                        print(e)
-                        break
-                endCallback = functools.partial(ScreenshotCallableLast, tutorial, _stepIndex)
-                qt.QTimer.singleShot(TUTORIAL_STEP_INTERVAL*functionIndex, endCallback)
-        # This needs to happen only after every possible tutorial is ran
-        if callback is not None:
-            def FinishCallback(callback):
-                if not TUTORIAL_STEP_DICT["FINISHED"]:
-                    finishCallback = functools.partial(FinishCallback, callback)
-                    qt.QTimer.singleShot(TUTORIAL_STEP_INTERVAL, finishCallback)
-                    return
-                callback()
-
-            finishCallback = functools.partial(FinishCallback, callback)
-            qt.QTimer.singleShot(TUTORIAL_STEP_INTERVAL*(functionIndex + 1), finishCallback)
-
-class NextCounter():
-    def __init__(self, count=0):
-        self.count = count
-    def next(self):
-        self.count += 1
-        return self.count - 1
+            tutorial = Tutorial(*info)
+            if language is not None:
+                tutorial.language = language
+            tutorial.verifyDependencies()
+            tutorial.clearTutorial()
+            tutorial.beginTutorial()
+            scheduler.addTutorial(tutorial, steps)
+        # The callback is called by the scheduler only after every tutorial is ran
+        scheduler.start()
+        return scheduler
+
+class TutorialStepScheduler():
+    """Runs the steps of the parsed tutorials one after the other.
+
+    A screenshot is taken after every step once the application settled: the render views
+    are updated, settleTime ms have elapsed and settleTurns more turns of the event loop ran,
+    so the layouts and renders posted by the step are done. The wait is bounded, the event
+    queue of Slicer is never empty (render and status timers keep posting). The next step
+    starts right after the screenshot is taken.
+
+    The steps of a tutorial are a generator resumed once per step, usually the tutorial test
+    itself, or a list of step functions.
+
+    A failed step stops its tutorial and the next one is ran. The failures are kept in errors,
+    the callback receives them once every tutorial is done (an empty list when all succeeded).
+    """
+    def __init__(self, settleTime=None, settleTurns=None, callback=None):
+        settings = slicer.app.userSettings()
+        if settleTime is None:
+            settleTime = int(settings.value("TutorialMaker/StepSettleTime", 250))
+        if settleTurns is None:
+            settleTurns = int(settings.value("TutorialMaker/StepSettleTurns", 3))
+        self.settleTime = settleTime
+        self.settleTurns = max(0, settleTurns)
+        self.callback = callback
+        self.running = False
+        self.errors = []
+        self.__tutorials = []
+        self.__tutorial = None
+        self.__steps = iter(())
+
+    def addTutorial(self, tutorial, steps):
+        if not inspect.isgenerator(steps):
+            steps = (step() for step in list(steps))
+        self.__tutorials.append([tutorial, steps])
+
+    def start(self):
+        self.running = True
+        qt.QTimer.singleShot(0, self.__nextTutorial)
+
+    def __nextTutorial(self):
+        if len(self.__tutorials) == 0:
+            self.__tutorial = None
+            self.running = False
+            if self.callback is not None:
+                self.callback(self.errors)
+            return
+        [self.__tutorial, self.__steps] = self.__tutorials.pop(0)
+        self.__runStep()
+
+    def __runStep(self):
+        try:
+            with Tracer.span("step", step=self.__tutorial.nSteps):
+                next(self.__steps)
+        except StopIteration:
+            try:
+                self.__tutorial.endTutorial()
+            except Exception as e:
+                logging.exception("Could not save the tutorial")
+                self.__addError(f"Could not save the tutorial: {e}")
+            self.__nextTutorial()
+            return
+        except Exception as e:
+            logging.exception(f"Tutorial step {self.__tutorial.nSteps} failed, stopping the tutorial")
+            self.__addError(f"Step {self.__tutorial.nSteps} failed: {e}")
+            self.__stopSteps()
+            self.__runStep()
+            return
+        self.__waitForSettle(self.__takeScreenshot)
+
+    def __addError(self, message):
+        self.errors.append(f"{self.__tutorial.metadata['title']}: {message}")
+
+    def __stopSteps(self):
+        # Closing the generator runs the finally blocks of the tutorial
+        self.__steps.close()
+        self.__steps = iter(())
+
+    def __takeScreenshot(self):
+        try:
+            self.__tutorial.nextScreenshot()
+        except Exception as e:
+            logging.exception(f"Screenshot {self.__tutorial.nSteps} failed, stopping the tutorial")
+            self.__addError(f"Screenshot {self.__tutorial.nSteps} failed: {e}")
+            self.__stopSteps()
+        # Let the stack unwind before running the next step
+        qt.QTimer.singleShot(0, self.__runStep)
+
+    def __waitForSettle(self, callback):
+        settleSpan = Tracer.span("settle", step=self.__tutorial.nSteps)
+        slicer.app.processEvents()
+        slicer.util.forceRenderAllViews()
+        qt.QTimer.singleShot(self.settleTime, functools.partial(self.__settleTurn, callback, self.settleTurns, settleSpan))
+
+    def __settleTurn(self, callback, turns, settleSpan):
+        # A zero timer fires only after the events already queued were processed
+        if turns > 0:
+            qt.QTimer.singleShot(0, functools.partial(self.__settleTurn, callback, turns - 1, settleSpan))
+            return
+        slicer.util.forceRenderAllViews()
+        settleSpan.end()
+        callback()
 
 class SignalManager(qt.QObject):
     received = qt.Signal(object)
@@ -680,13 +859,211 @@ class SignalManager(qt.QObject):
     def emit(self, msg):
         self.received.emit(msg)
 
+class ScreenshotWriter():
+    """Writes the captured files from a pool of worker threads.
+
+    Every write is queued with submit() and runs in the background, flush() blocks until
+    all the queued writes finished and raises if any of them failed.
+    """
+    def __init__(self, maxWorkers=None):
+        from concurrent.futures import ThreadPoolExecutor
+        if maxWorkers is None:
+            maxWorkers = min(4, os.cpu_count() or 1)
+        self.__executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="TutorialMakerWriter")
+        self.__pending = []
+
+    def submit(self, func, *args):
+        # Finished writes are dropped, failed ones are kept to be reported by flush()
+        self.__pending = [future for future in self.__pending if not future.done() or future.exception() is not None]
+        future = self.__executor.submit(func, *args)
+        self.__pending.append(future)
+        return future
+
+    def saveImage(self, image, filename, format="PNG"):
+        # Only QImage can be used outside of the GUI thread, never pass a QPixmap here
+        return self.submit(ScreenshotWriter.__writeImage, image, filename, format)
+
+    def flush(self):
+        errors = []
+        for future in self.__pending:
+            if future.exception() is not None:
+                errors.append(future.exception())
+        self.__pending = []
+        if len(errors) > 0:
+            for error in errors:
+                logging.error("Screenshot file not written", exc_info=error)
+            raise Exception(_("Failed to write {count} screenshot files").format(count=len(errors)))
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True)
+
+    @staticmethod
+    def __writeImage(image, filename, format):
+        if not image.save(filename, format):
+            raise OSError(f"Could not write {filename}")
+
+class BackgroundLoader():
+    """Runs loading functions on a pool of worker threads and hands their results to the GUI thread.
+
+    The futures are polled by a QTimer, so the callbacks run on the GUI thread and can create
+    pixmaps and widgets. The loading functions must only do thread safe work, like decoding a
+    QImage or parsing files. A failed load is logged and its callback receives None.
+    """
+    def __init__(self, maxWorkers=None, pollInterval=30):
+        from concurrent.futures import ThreadPoolExecutor
+        if maxWorkers is None:
+            maxWorkers = min(4, os.cpu_count() or 1)
+        self.__executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="TutorialMakerLoader")
+        self.__pending = []
+        self.__timer = qt.QTimer()
+        self.__timer.setInterval(pollInterval)
+        self.__timer.timeout.connect(self.__poll)
+
+    def submit(self, func, callback, *args):
+        future = self.__executor.submit(func, *args)
+        self.__pending.append([future, callback])
+        if not self.__timer.isActive():
+            self.__timer.start()
+        return future
+
+    def pendingCount(self):
+        return len(self.__pending)
+
+    def cancel(self):
+        """Drop the loads not started yet, the callbacks of the running ones are never called"""
+        for [future, callback] in self.__pending:
+            future.cancel()
+        self.__pending = []
+        self.__timer.stop()
+
+    def __poll(self):
+        done = []
+        pending = []
+        for entry in self.__pending:
+            if entry[0].done():
+                done.append(entry)
+            else:
+                pending.append(entry)
+        self.__pending = pending
+        if len(pending) == 0:
+            self.__timer.stop()
+        for [future, callback] in done:
+            if future.cancelled():
+                continue
+            result = None
+            try:
+                result = future.result()
+            except Exception:
+                logging.exception("Background loading failed")
+            callback(result)
+
+class ScreenshotStore():
+    """Content addressed storage of the captured windows, under Outputs/Store/.
+
+    blobs/ holds every captured PNG and metadata JSON once, named by the content hash of the
+    window. runs/ holds one manifest per tutorial and language, with the tutorial metadata and
+    the blob of every step and window. Outputs/Raw/ only links to the blobs, so clearing it
+    does not delete the captures and a frame already captured by any run is not written again.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = get_output_path() + "/Store/"
+        self.path = path
+        os.makedirs(self.path + "blobs", exist_ok=True)
+        os.makedirs(self.path + "runs", exist_ok=True)
+
+    def blobPath(self, digest, extension):
+        return f"{self.path}blobs/{digest[:2]}/{digest}{extension}"
+
+    def addBlob(self, digest, extension, writeFile):
+        """writeFile(path) is only called when the blob is not already in the store"""
+        path = self.blobPath(digest, extension)
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tempPath = f"{path}.{threading.get_ident()}.tmp"
+        writeFile(tempPath)
+        os.replace(tempPath, path)
+        return path
+
+    @staticmethod
+    def runName(title, language):
+        return re.sub(r"[^\w\-]+", "_", f"{title}_{language}").strip("_")
+
+    def saveManifest(self, name, metadata, stepsList):
+        manifest = dict(metadata)
+        manifest["steps"] = []
+        for step in stepsList:
+            windows = []
+            for screenshot in step:
+                windows.append({
+                    "window": os.path.relpath(self.blobPath(screenshot.hash, ".png"), self.path).replace(os.sep, "/"),
+                    "metadata": os.path.relpath(self.blobPath(screenshot.hash, os.path.splitext(screenshot.metadata)[1]), self.path).replace(os.sep, "/"),
+                    "hash": screenshot.hash
+                })
+            manifest["steps"].append(windows)
+        path = f"{self.path}runs/{name}.json"
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def listRuns(self):
+        return sorted(file[:-len(".json")] for file in os.listdir(self.path + "runs") if file.endswith(".json"))
+
+    def loadManifest(self, name):
+        with open(f"{self.path}runs/{name}.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def checkoutRun(self, name):
+        """Link a stored run back into Outputs/Raw/ with its Tutorial.json, to annotate it"""
+        rawPath = get_output_path() + "/Raw/"
+        manifest = self.loadManifest(name)
+        Tutorial.clearTutorial()
+        os.makedirs(rawPath, exist_ok=True)
+        for stepIndex, step in enumerate(manifest["steps"]):
+            os.makedirs(f"{rawPath}{stepIndex}", exist_ok=True)
+            for windowIndex, window in enumerate(step):
+                ScreenshotTools.linkFile(self.path + window["window"], f"{rawPath}{stepIndex}/{windowIndex}.png")
+                metadataExtension = os.path.splitext(window["metadata"])[1]
+                ScreenshotTools.linkFile(self.path + window["metadata"], f"{rawPath}{stepIndex}/{windowIndex}{metadataExtension}")
+                window["window"] = f"{stepIndex}/{windowIndex}.png"
+                window["metadata"] = f"{stepIndex}/{windowIndex}{metadataExtension}"
+        with open(rawPath + "Tutorial.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+    def collectGarbage(self):
+        """Delete the blobs no manifest refers to anymore, returns the number of deleted files"""
+        used = set()
+        for name in self.listRuns():
+            for step in self.loadManifest(name)["steps"]:
+                for window in step:
+                    used.add(window["window"])
+                    used.add(window["metadata"])
+        deleted = 0
+        for folder in os.listdir(self.path + "blobs"):
+            for file in os.listdir(f"{self.path}blobs/{folder}"):
+                if f"blobs/{folder}/{file}" not in used:
+                    os.remove(f"{self.path}blobs/{folder}/{file}")
+                    deleted += 1
+        return deleted
+
 class ScreenshotTools():
     def __init__(self) -> None:
         self.handler = JSONHandler()
+        self.writer = ScreenshotWriter()
+        self.store = ScreenshotStore()
+        # "json" or "compact", see CompactWidgetMetadata
+        self.metadataFormat = slicer.app.userSettings().value("TutorialMaker/MetadataFormat", "json")
+        # Content hash -> threading.Event set once the blobs of that window are in the store
+        self.__windowsByHash = {}
+        self.__windowsLock = threading.Lock()
+        # Bytes of the stored files, only counted while tracing
+        self.__bytesWritten = 0
         pass
 
     def saveScreenshotMetadata(self, index):
-        path = get_module_basepath("TutorialMaker") + "/Outputs/Raw/"
+        path = get_output_path() + "/Raw/"
 
         openWindows = []
         for w in slicer.app.topLevelWidgets():
@@ -699,21 +1076,33 @@ class ScreenshotTools():
             pass
 
         windows = []
-        for wIndex in range(len(openWindows)):
-            if not os.path.exists(path + str(index)):
-                os.mkdir(path + str(index))
-                pass
+        widgetCount = 0
+        # The memo is dropped after every step, so the next screenshot sees the updated widgets
+        Widget.beginCapture()
+        try:
+            for wIndex in range(len(openWindows)):
+                if not os.path.exists(path + str(index)):
+                    os.mkdir(path + str(index))
+                    pass
 
-            screenshotData = TutorialScreenshot()
-            screenshotData.screenshot = path + str(index) + "/" + str(wIndex) + ".png"
-            screenshotData.metadata = path + str(index) + "/" + str(wIndex) + ".json"
+                screenshotData = TutorialScreenshot()
+                screenshotData.screenshot = path + str(index) + "/" + str(wIndex) + ".png"
+                screenshotData.metadata = path + str(index) + "/" + str(wIndex) + self.__metadataExtension()
 
-            self.saveScreenshot(screenshotData.screenshot, openWindows[wIndex])
-            self.saveAllWidgetsData(screenshotData.metadata, openWindows[wIndex])
+                # Grabbing and walking the widgets need the GUI thread, the rest runs on the writers
+                with Tracer.span("grab", window=wIndex):
+                    image = self.getPixmap(openWindows[wIndex]).toImage()
+                with Tracer.span("walk", window=wIndex) as span:
+                    data = self.getAllWidgetsData(openWindows[wIndex])
+                    span.set(widgets=len(data))
+                widgetCount += len(data)
+                self.writer.submit(self.__saveWindow, screenshotData, image, data)
 
-            windows.append(screenshotData)
-            pass
-        pass
+                windows.append(screenshotData)
+                pass
+        finally:
+            Widget.endCapture()
+        Tracer.counter("widgets", widgets=widgetCount)
         return windows
 
     def getPixmap(self, window):
@@ -722,18 +1111,103 @@ class ScreenshotTools():
         return pixmap
 
     def saveScreenshot(self, filename, window):
-        self.getPixmap(window).save(filename, "PNG")
+        # The PNG encoding runs on the writer threads, call flush() to wait for the file
+        self.writer.saveImage(self.getPixmap(window).toImage(), filename, "PNG")
         pass
 
+    def flush(self):
+        self.writer.flush()
+
+    def shutdown(self):
+        """Wait for the pending writes and stop the writer threads, flush() reports the failures"""
+        self.writer.shutdown()
+
+    def __saveWindow(self, screenshotData, image, data):
+        # Runs on a writer thread. The files go to the store under the content hash of the window
+        # (same pixels and same widgets), so a window already captured is not encoded again, and
+        # Outputs/Raw/ gets links to them
+        with Tracer.span("hash"):
+            digest = ScreenshotTools.contentHash(image, data)
+        screenshotData.hash = digest
+        with self.__windowsLock:
+            written = self.__windowsByHash.get(digest)
+            first = written is None
+            if first:
+                written = threading.Event()
+                self.__windowsByHash[digest] = written
+        if first:
+            try:
+                with Tracer.span("encode") as span:
+                    self.store.addBlob(digest, ".png", functools.partial(ScreenshotTools.__writeImage, image))
+                    span.set(bytes=self.__countBytes(digest, ".png"))
+                with Tracer.span("write metadata") as span:
+                    if self.metadataFormat == "compact":
+                        self.store.addBlob(digest, self.__metadataExtension(), functools.partial(CompactWidgetMetadata.save, data))
+                    else:
+                        self.store.addBlob(digest, self.__metadataExtension(), functools.partial(self.handler.saveScreenshotMetadata, data))
+                    span.set(bytes=self.__countBytes(digest, self.__metadataExtension()))
+            finally:
+                written.set()
+        else:
+            written.wait()
+        ScreenshotTools.linkFile(self.store.blobPath(digest, ".png"), screenshotData.screenshot)
+        ScreenshotTools.linkFile(self.store.blobPath(digest, self.__metadataExtension()), screenshotData.metadata)
+
+    def __countBytes(self, digest, extension):
+        if not Tracer.enabled:
+            return 0
+        size = os.path.getsize(self.store.blobPath(digest, extension))
+        with self.__windowsLock:
+            self.__bytesWritten += size
+            Tracer.counter("bytes written", bytes=self.__bytesWritten)
+        return size
+
+    def __metadataExtension(self):
+        if self.metadataFormat == "compact":
+            return CompactWidgetMetadata.extension
+        return ".json"
+
+    @staticmethod
+    def __writeImage(image, path):
+        if not image.save(path, "PNG"):
+            raise OSError(f"Could not write {path}")
+
+    @staticmethod
+    def contentHash(image, data):
+        buffer = qt.QBuffer()
+        buffer.open(qt.QIODevice.WriteOnly)
+        # Uncompressed, this is only a way to get the raw pixels in a byte array
+        image.save(buffer, "BMP")
+        digest = hashlib.sha1(buffer.data().data())
+        digest.update(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def linkFile(source, destination):
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copyfile(source, destination)
+
     def saveAllWidgetsData(self, filename, window):
+        data = self.getAllWidgetsData(window)
+        self.writer.submit(self.handler.saveScreenshotMetadata, data, filename)
+
+    def getAllWidgetsData(self, window):
         data = {}
-        data["_devicePixelRatio"] = slicer.app.desktop().devicePixelRatioF()
-        widgets = Util.getOnScreenWidgets(window)
+        devicePixelRatio = slicer.app.desktop().devicePixelRatioF()
+        data["_devicePixelRatio"] = devicePixelRatio
+        mw = slicer.util.mainWindow()
+        windowPos = mw.mapToGlobal(mw.rect.topLeft())
+        widgets = Util.getOnScreenWidgetsWithPaths(window)
         for index in range(len(widgets)):
+            [widget, widgetPath] = widgets[index]
             try:
-                if hasattr(widgets[index].inner(), "isVisible") and not widgets[index].inner().isVisible():
+                if hasattr(widget.inner(), "isVisible") and not widget.inner().isVisible():
                     continue
-                data[index] = {"name": widgets[index].name, "path": Util.uniqueWidgetPath(widgets[index]), "text": widgets[index].text, "position": widgets[index].getGlobalPos(), "size": widgets[index].getSize()}
+                data[index] = {"name": widget.name, "path": widgetPath, "text": widget.text, "position": widget.getGlobalPos(windowPos, devicePixelRatio), "size": widget.getSize(devicePixelRatio)}
                 pass
             except AttributeError:
                 #Working as expected, so to not save QObjects that are not QWidgets
@@ -741,7 +1215,7 @@ class ScreenshotTools():
             except Exception as e:
                 print(e)
                 pass
-        self.handler.saveScreenshotMetadata(data, filename)
+        return data
 
 class Tutorial():
     def __init__(self,
@@ -758,6 +1232,8 @@ class Tutorial():
         self.metadata["desc"] = description
         self.metadata["dependencies"] = dependencies.split(",") if dependencies != "" else []
 
+        # Language of the interface while capturing, the captures of each language are kept apart
+        self.language = slicer.app.userSettings().value("language") or "en"
         self.steps = []
 
     def verifyDependencies(self):
@@ -769,12 +1245,15 @@ class Tutorial():
 
     def beginTutorial(self):
         screenshotTools = ScreenshotTools()
-        answer = slicer.util.confirmYesNoDisplay(
-            _("Closing the Python Console and Error Log windows will provide more screen space for the 3D Slicer views"),
-            _("Tutorial Maker View Setup"),
-            okButtonText=_("Close Windows (Recommended)"),
-            cancelButtonText=_("Keep Windows Open")
-        )
+        # Without anybody to answer, the recommended choice
+        answer = True
+        if is_interactive():
+            answer = slicer.util.confirmYesNoDisplay(
+                _("Closing the Python Console and Error Log windows will provide more screen space for the 3D Slicer views"),
+                _("Tutorial Maker View Setup"),
+                okButtonText=_("Close Windows (Recommended)"),
+                cancelButtonText=_("Keep Windows Open")
+            )
         if answer:
             slicer.util.mainWindow().pythonConsole().parent().setVisible(False)
             slicer.util.mainWindow().errorLogWidget().parent().setVisible(False)
@@ -783,8 +1262,10 @@ class Tutorial():
         self.screenshottools = screenshotTools
 
     #TODO:Unsafe, there should be a better method to do this, at least add some conditions
-    def clearTutorial(self):
-        outputPath = get_module_basepath("TutorialMaker") + "/Outputs/Raw/"
+    # The captures live in Outputs/Store/, Outputs/Raw/ only holds links to them
+    @staticmethod
+    def clearTutorial():
+        outputPath = get_output_path() + "/Raw/"
         if not os.path.exists(outputPath):
             return
         dirs = os.listdir(outputPath)
@@ -799,62 +1280,149 @@ class Tutorial():
 
     def nextScreenshot(self, overwriteName=None):
         if type(overwriteName) is str:
-            self.steps.append(self.screenshottools.saveScreenshotMetadata(overwriteName))
+            with Tracer.span("screenshot", step=overwriteName):
+                self.steps.append(self.screenshottools.saveScreenshotMetadata(overwriteName))
             self.nSteps = self.nSteps + 1
             return
-        self.steps.append(self.screenshottools.saveScreenshotMetadata(self.nSteps))
+        with Tracer.span("screenshot", step=self.nSteps) as span:
+            self.steps.append(self.screenshottools.saveScreenshotMetadata(self.nSteps))
+            span.set(windows=len(self.steps[-1]))
         self.nSteps = self.nSteps + 1
     pass
 
     def endTutorial(self):
+        # Tutorial.json must only reference files that are already on disk
+        if hasattr(self, "screenshottools"):
+            try:
+                with Tracer.span("flush writers"):
+                    self.screenshottools.flush()
+            finally:
+                # A ScreenshotTools is created per tutorial, its threads must not outlive it
+                self.screenshottools.shutdown()
         handler = JSONHandler()
         handler.saveTutorial(self.metadata, self.steps)
+        if hasattr(self, "screenshottools"):
+            metadata = dict(self.metadata)
+            metadata["language"] = self.language
+            del metadata["steps"]
+            runName = ScreenshotStore.runName(self.metadata["title"], self.language)
+            self.screenshottools.store.saveManifest(runName, metadata, self.steps)
+        Tracer.write(get_output_path() + "/Raw/Tutorial.trace.json")
 
 class TutorialScreenshot():
     def __init__(self, screenshot="", metadata=""):
         self.screenshot = screenshot
         self.metadata = metadata
+        # Hash of the pixels and widgets of the window, set when captured
+        self.hash = None
+        # [metadata path, parsed metadata], loaded on first use
+        self.__parsedMetadata = None
         pass
 
+    def __getMetadata(self):
+        if self.__parsedMetadata is None or self.__parsedMetadata[0] != self.metadata:
+            self.__parsedMetadata = [self.metadata, MetadataCache.get(self.metadata)]
+        return self.__parsedMetadata[1]
+
     def getImage(self):
+        pixmap = qt.QPixmap.fromImage(self.loadImage())
+        pixmap.setDevicePixelRatio(1.0)
+        return pixmap
+
+    def loadImage(self):
+        """Decoded screenshot scaled to logical pixels as a QImage, safe to call from a worker thread"""
         image = qt.QImage(self.screenshot)
-        pixmap = qt.QPixmap.fromImage(image)
         
         dpr = self.getDevicePixelRatio()
         if dpr > 1.0:
-            logicalWidth = int(pixmap.width() / dpr)
-            logicalHeight = int(pixmap.height() / dpr)
-            pixmap = pixmap.scaled(logicalWidth, logicalHeight, qt.Qt.KeepAspectRatio, qt.Qt.SmoothTransformation)
+            logicalWidth = int(image.width() / dpr)
+            logicalHeight = int(image.height() / dpr)
+            image = image.scaled(logicalWidth, logicalHeight, qt.Qt.KeepAspectRatio, qt.Qt.SmoothTransformation)
         
-        pixmap.setDevicePixelRatio(1.0)
-        return pixmap
+        image.setDevicePixelRatio(1.0)
+        return image
+
+    def getImageSize(self):
+        """Size of the image returned by getImage, read from the file header without decoding it"""
+        size = qt.QImageReader(self.screenshot).size()
+        dpr = self.getDevicePixelRatio()
+        if dpr > 1.0:
+            return [int(size.width() / dpr), int(size.height() / dpr)]
+        return [size.width(), size.height()]
+
     def getWidgets(self):
         widgets = []
-        nWidgets = JSONHandler.parseJSON(self.metadata)
+        nWidgets = self.__getMetadata()
         dpr = self.getDevicePixelRatio()
         
         for keys in nWidgets:
             if isinstance(keys, str) and keys.startswith("_"):
                 continue
             
+            # The parsed metadata is shared through the cache, the copies must not share anything with it
             widget = nWidgets[keys].copy() if hasattr(nWidgets[keys], 'copy') else dict(nWidgets[keys])
             
             if dpr > 1.0:
                 widget["position"] = [widget["position"][0] / dpr, widget["position"][1] / dpr]
                 widget["size"] = [widget["size"][0] / dpr, widget["size"][1] / dpr]
+            else:
+                widget["position"] = list(widget["position"])
+                widget["size"] = list(widget["size"])
             
             widgets.append(widget)
         return widgets
     
     def getDevicePixelRatio(self):
         """Get the device pixel ratio saved with this screenshot, defaults to 1.0"""
-        nWidgets = JSONHandler.parseJSON(self.metadata)
+        nWidgets = self.__getMetadata()
         return nWidgets.get("_devicePixelRatio", 1.0)
 
+class MetadataCache():
+    """Process wide LRU cache of the parsed screenshot metadata files.
+
+    Entries are keyed by path and checked against the modification time and size of the file,
+    a file rewritten by a new capture is parsed again. The returned dicts are shared, callers
+    must copy what they modify.
+    """
+    maxEntries = 256
+    __entries = OrderedDict()
+    __lock = threading.Lock()
+
+    @staticmethod
+    def get(path):
+        if path == "":
+            return {}
+        statPath = path
+        if not os.path.exists(path) and os.path.exists(CompactWidgetMetadata.compactPath(path)):
+            statPath = CompactWidgetMetadata.compactPath(path)
+        try:
+            stat = os.stat(statPath)
+        except OSError:
+            # Let the parser raise the usual FileNotFoundError
+            return JSONHandler.parseJSON(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with MetadataCache.__lock:
+            entry = MetadataCache.__entries.get(path)
+            if entry is not None and entry[0] == key:
+                MetadataCache.__entries.move_to_end(path)
+                return entry[1]
+        data = JSONHandler.parseJSON(path)
+        with MetadataCache.__lock:
+            MetadataCache.__entries[path] = (key, data)
+            MetadataCache.__entries.move_to_end(path)
+            while len(MetadataCache.__entries) > MetadataCache.maxEntries:
+                MetadataCache.__entries.popitem(last=False)
+        return data
+
+    @staticmethod
+    def clear():
+        with MetadataCache.__lock:
+            MetadataCache.__entries.clear()
+
 # TODO: REMOVE THIS, DEPRECATED
 class JSONHandler:
     def __init__(self):
-        self.path = get_module_basepath("TutorialMaker") + "/Outputs/Raw/"
+        self.path = get_output_path() + "/Raw/"
         if not os.path.exists(self.path):
             os.mkdir(self.path)
         import json
@@ -887,6 +1455,11 @@ class JSONHandler:
     def parseJSON(path):
         if path == "":
             return {}
+        # Captures saved in the compact format, callers may still ask for the .json file
+        if CompactWidgetMetadata.isCompact(path):
+            return CompactWidgetMetadata.load(path)
+        if not os.path.exists(path) and os.path.exists(CompactWidgetMetadata.compactPath(path)):
+            return CompactWidgetMetadata.load(CompactWidgetMetadata.compactPath(path))
         import json
         with open(path, encoding='utf-8') as file:
             data = json.load(file)
@@ -901,6 +1474,8 @@ class JSONHandler:
                 datapair = {}
                 datapair["window"] = screenshot.screenshot.replace(self.path, "")
                 datapair["metadata"] = screenshot.metadata.replace(self.path, "")
+                if screenshot.hash is not None:
+                    datapair["hash"] = screenshot.hash
                 windows.append(datapair)
             pass
             metadata["steps"].append(windows)
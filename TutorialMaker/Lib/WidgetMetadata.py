@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import array
+import struct
+
+class CompactWidgetMetadata():
+    """Packed binary version of the widget metadata saved for every captured window.
+
+    The JSON metadata repeats the full path of every widget and is slow to write and parse.
+    Here the strings (names, texts and path segments) are stored once, the paths are a table of
+    (parent prefix, segment) pairs, and the widgets are parallel arrays:
+
+        header    struct "<4sBI"      magic, version, size of the strings block
+        strings   UTF-8 JSON          {"meta": {<"_" keys of the metadata>}, "strings": [...]}
+        prefixes  struct "<I"         count, then int32 parents[count], uint32 segments[count]
+        widgets   struct "<I"         count, then uint32 indexes, names, texts, paths[count]
+                                      and float64 positions, sizes[2*count]
+
+    load() returns the same dict as the JSON file, the JSON stays the export format.
+    """
+    extension = ".wmeta"
+    __magic = b"TMWM"
+    __version = 1
+
+    @staticmethod
+    def isCompact(path):
+        return path.endswith(CompactWidgetMetadata.extension)
+
+    @staticmethod
+    def compactPath(jsonPath):
+        return os.path.splitext(jsonPath)[0] + CompactWidgetMetadata.extension
+
+    @staticmethod
+    def save(data, path):
+        strings = []
+        stringIds = {}
+        def intern(value):
+            # The texts are not always strings, the JSON block keeps their type
+            key = (type(value).__name__, value if isinstance(value, (str, int, float, bool, type(None))) else json.dumps(value))
+            if key not in stringIds:
+                stringIds[key] = len(strings)
+                strings.append(value)
+            return stringIds[key]
+
+        prefixIds = {}
+        parents = array.array("i")
+        segments = array.array("I")
+        def prefix(widgetPath):
+            if widgetPath not in prefixIds:
+                [head, separator, tail] = widgetPath.rpartition("/")
+                parent = prefix(head) if separator != "" else -1
+                prefixIds[widgetPath] = len(parents)
+                parents.append(parent)
+                segments.append(intern(tail))
+            return prefixIds[widgetPath]
+
+        meta = {}
+        indexes = array.array("I")
+        names = array.array("I")
+        texts = array.array("I")
+        paths = array.array("I")
+        positions = array.array("d")
+        sizes = array.array("d")
+        for key, widget in data.items():
+            if isinstance(key, str) and key.startswith("_"):
+                meta[key] = widget
+                continue
+            indexes.append(int(key))
+            names.append(intern(widget["name"]))
+            texts.append(intern(widget["text"]))
+            paths.append(prefix(widget["path"]))
+            positions.extend(widget["position"])
+            sizes.extend(widget["size"])
+
+        stringBlock = json.dumps({"meta": meta, "strings": strings}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        columns = [parents, segments, indexes, names, texts, paths, positions, sizes]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sBI", CompactWidgetMetadata.__magic, CompactWidgetMetadata.__version, len(stringBlock)))
+            f.write(stringBlock)
+            f.write(struct.pack("<I", len(parents)))
+            f.write(parents.tobytes())
+            f.write(segments.tobytes())
+            f.write(struct.pack("<I", len(indexes)))
+            for column in columns[2:]:
+                f.write(column.tobytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            content = f.read()
+        [magic, version, stringBlockSize] = struct.unpack_from("<4sBI", content, 0)
+        if magic != CompactWidgetMetadata.__magic or version != CompactWidgetMetadata.__version:
+            raise ValueError(f"{path} is not a compact widget metadata file")
+        offset = struct.calcsize("<4sBI")
+        stringBlock = json.loads(content[offset:offset + stringBlockSize].decode("utf-8"))
+        strings = stringBlock["strings"]
+        offset += stringBlockSize
+
+        def readColumn(typecode, count):
+            nonlocal offset
+            column = array.array(typecode)
+            column.frombytes(content[offset:offset + count * column.itemsize])
+            if sys.byteorder != "little":
+                column.byteswap()
+            offset += count * column.itemsize
+            return column
+
+        [prefixCount] = struct.unpack_from("<I", content, offset)
+        offset += 4
+        parents = readColumn("i", prefixCount)
+        segments = readColumn("I", prefixCount)
+        # A prefix always comes after its parent, so the paths are built in one pass
+        prefixes = []
+        for prefixIndex in range(prefixCount):
+            if parents[prefixIndex] < 0:
+                prefixes.append(strings[segments[prefixIndex]])
+            else:
+                prefixes.append(prefixes[parents[prefixIndex]] + "/" + strings[segments[prefixIndex]])
+
+        [count] = struct.unpack_from("<I", content, offset)
+        offset += 4
+        indexes = readColumn("I", count)
+        names = readColumn("I", count)
+        texts = readColumn("I", count)
+        paths = readColumn("I", count)
+        positions = readColumn("d", 2 * count)
+        sizes = readColumn("d", 2 * count)
+
+        data = dict(stringBlock["meta"])
+        for i in range(count):
+            data[str(indexes[i])] = {
+                "name": strings[names[i]],
+                "path": prefixes[paths[i]],
+                "text": strings[texts[i]],
+                "position": [positions[2 * i], positions[2 * i + 1]],
+                "size": [sizes[2 * i], sizes[2 * i + 1]]
+            }
+        return data
+
+    @staticmethod
+    def exportJSON(path, jsonPath=None):
+        """Write the JSON version of a compact metadata file, next to it by default"""
+        if jsonPath is None:
+            jsonPath = os.path.splitext(path)[0] + ".json"
+        with open(jsonPath, "w", encoding="utf-8") as f:
+            json.dump(CompactWidgetMetadata.load(path), f, ensure_ascii=False, indent=4)
+        return jsonPath
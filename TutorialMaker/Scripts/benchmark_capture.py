@@ -0,0 +1,241 @@
+"""Time the capture hot paths on synthetic widget trees, to compare the scaling between versions.
+
+Run it with the Slicer executable, the arguments after the script are its own:
+
+    Slicer --no-splash --python-script TutorialMaker/Scripts/benchmark_capture.py \
+        --depths 2 3 4 --fanouts 4 8 --tree-rows 0 200 --output benchmark.json
+
+Every combination of the depths, fan-outs, list items, tree rows and menu actions is a case. A case
+is a widget hierarchy built offscreen (shown, but never on the screen): <fanout> named frames per
+level down to <depth>, unnamed buttons as leaves (found by Class:index paths), a QListWidget, a
+subject hierarchy tree view and a menu bar with menus of actions. The results of all the cases, with
+the versions of Slicer, Qt and of the module, are written to the output JSON file. Slicer exits with
+0 when the benchmark ran and 1 when it failed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import shutil
+import itertools
+import statistics
+import subprocess
+import tempfile
+import traceback
+
+import qt
+import slicer
+
+# The module folder, so that Lib can be imported when the module is not loaded
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EXIT_OK = 0
+EXIT_BENCHMARK_FAILED = 1
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the widget walks of the screenshot capture")
+    parser.add_argument("--depths", type=int, nargs="+", default=[2, 3, 4], help="Levels of frames under the root")
+    parser.add_argument("--fanouts", type=int, nargs="+", default=[4], help="Children of every frame")
+    parser.add_argument("--list-items", type=int, nargs="+", default=[50], help="Items of the list widget")
+    parser.add_argument("--tree-rows", type=int, nargs="+", default=[50], help="Rows of the subject hierarchy tree view")
+    parser.add_argument("--menus", type=int, default=3, help="Menus of the menu bar")
+    parser.add_argument("--menu-actions", type=int, nargs="+", default=[20], help="Actions of every menu")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of every function")
+    parser.add_argument("--path-sample", type=int, default=200,
+                        help="Widgets whose path is built and looked up per run, 0 for all of them")
+    parser.add_argument("--label", default="", help="Free text stored with the results, the branch or change tested")
+    parser.add_argument("--output", default="capture_benchmark.json", help="JSON file receiving the results")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary folder of the captures, its path is printed")
+    return parser.parse_args(argv)
+
+def module_revision():
+    modulePath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=modulePath,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def build_tree(depth, fanout, listItems, treeRows, menus, menuActions):
+    root = qt.QWidget()
+    root.setObjectName("BenchmarkRoot")
+    # Visible for the capture, but not on the screen
+    root.setAttribute(qt.Qt.WA_DontShowOnScreen)
+    layout = qt.QVBoxLayout(root)
+
+    menuBar = qt.QMenuBar(root)
+    menuBar.setObjectName("BenchmarkMenuBar")
+    menuList = []
+    for menuIndex in range(menus):
+        menu = menuBar.addMenu(f"Menu {menuIndex}")
+        menu.setObjectName(f"BenchmarkMenu_{menuIndex}")
+        menuList.append(menu)
+        for actionIndex in range(menuActions):
+            menu.addAction(f"Action {menuIndex}.{actionIndex}")
+    layout.setMenuBar(menuBar)
+
+    def addFrames(parent, parentName, level):
+        parentLayout = qt.QHBoxLayout(parent) if level % 2 else qt.QVBoxLayout(parent)
+        for index in range(fanout):
+            if level == depth:
+                button = qt.QPushButton(f"{parentName} {index}", parent)
+                parentLayout.addWidget(button)
+                continue
+            frame = qt.QFrame(parent)
+            frame.setObjectName(f"{parentName}_{index}")
+            parentLayout.addWidget(frame)
+            addFrames(frame, frame.objectName, level + 1)
+
+    frames = qt.QFrame(root)
+    frames.setObjectName("Frame")
+    layout.addWidget(frames)
+    addFrames(frames, "Frame", 1)
+
+    listWidget = qt.QListWidget(root)
+    listWidget.setObjectName("BenchmarkList")
+    for index in range(listItems):
+        listWidget.addItem(f"Item {index}")
+    layout.addWidget(listWidget)
+
+    slicer.mrmlScene.Clear()
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    for index in range(treeRows):
+        shNode.CreateFolderItem(shNode.GetSceneItemID(), f"Folder {index}")
+    treeView = slicer.qMRMLSubjectHierarchyTreeView(root)
+    treeView.setObjectName("BenchmarkTree")
+    treeView.setMRMLScene(slicer.mrmlScene)
+    # Every row gets a rectangle, as when the tree is scrolled through
+    treeView.setMinimumHeight(treeView.sizeHintForRow(0) * (treeRows + 2) if treeRows > 0 else 50)
+    layout.addWidget(treeView)
+
+    root.show()
+    root.resize(root.sizeHint)
+    slicer.app.processEvents()
+    return [root, menuList]
+
+def destroy_tree(root):
+    root.hide()
+    root.setParent(None)
+    root.deleteLater()
+    slicer.app.processEvents()
+    slicer.mrmlScene.Clear()
+
+def sample(values, count):
+    if count <= 0 or len(values) <= count:
+        return values
+    step = len(values) / count
+    return [values[int(index * step)] for index in range(count)]
+
+def measure(func, repeat):
+    """Run func repeat times after a warm up run, returns the timings in ms and the last result"""
+    result = func()
+    timings = []
+    for run in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"min": round(min(timings), 3),
+            "median": round(statistics.median(timings), 3),
+            "mean": round(statistics.mean(timings), 3),
+            "runs": [round(timing, 3) for timing in timings]}, result
+
+def run_case(parameters, args, outputFolder):
+    from Lib.TutorialUtils import Util, Widget, ScreenshotTools
+
+    [root, menus] = build_tree(**parameters)
+    try:
+        rootWidget = Widget(root)
+        timings = {}
+        timings["Util.getOnScreenWidgets"], widgets = measure(lambda: Util.getOnScreenWidgets(root), args.repeat)
+        timings["Util.getOnScreenWidgetsWithPaths"], widgetsWithPaths = measure(
+            lambda: Util.getOnScreenWidgetsWithPaths(root), args.repeat)
+
+        sampled = sample(widgets, args.path_sample)
+        timings["Util.uniqueWidgetPath"], paths = measure(
+            lambda: [Util.uniqueWidgetPath(widget) for widget in sampled], args.repeat)
+
+        # The paths start with the root name, the lookup starts from the root
+        lookups = [path.split("/", 1)[1] for [widget, path] in sample(widgetsWithPaths, args.path_sample)]
+        timings["Util.getNamedWidget"], found = measure(
+            lambda: [Util.getNamedWidget(path, rootWidget) for path in lookups], args.repeat)
+
+        # The menus are popups, skipped by the walk, their actions are only listed by getChildren
+        allWidgets = [rootWidget] + widgets + [Widget(menu) for menu in menus]
+        timings["Widget.getChildren"], children = measure(
+            lambda: [widget.getChildren() for widget in allWidgets], args.repeat)
+
+        tools = ScreenshotTools()
+        metadataPath = os.path.join(outputFolder, "benchmark_metadata.json")
+        def saveAllWidgetsData():
+            tools.saveAllWidgetsData(metadataPath, root)
+            tools.flush()
+        timings["ScreenshotTools.saveAllWidgetsData"], _ = measure(saveAllWidgetsData, args.repeat)
+        tools.shutdown()
+
+        return {"parameters": parameters,
+                "widgets": len(widgets),
+                "virtualWidgets": len([widget for widget in widgets if widget.className.startswith("X")]),
+                "sampledPaths": len(sampled),
+                "pathsFound": len([widget for widget in found if widget is not None]),
+                "metadataBytes": os.path.getsize(metadataPath),
+                "timings": timings}
+    finally:
+        destroy_tree(root)
+
+def benchmark(args):
+    # ScreenshotTools creates its Raw and Store folders in the output folder, keep them out of Outputs
+    outputFolder = tempfile.mkdtemp(prefix="TutorialMakerBenchmark_")
+    setOutputDir = os.environ.get("TUTORIALMAKER_OUTPUT_DIR", "") == ""
+    if setOutputDir:
+        os.environ["TUTORIALMAKER_OUTPUT_DIR"] = outputFolder
+    try:
+        os.makedirs(os.path.join(os.environ["TUTORIALMAKER_OUTPUT_DIR"], "Raw"), exist_ok=True)
+
+        cases = [dict(zip(["depth", "fanout", "listItems", "treeRows", "menuActions"], values), menus=args.menus)
+                 for values in itertools.product(args.depths, args.fanouts, args.list_items, args.tree_rows, args.menu_actions)]
+        results = []
+        for parameters in cases:
+            result = run_case(parameters, args, outputFolder)
+            results.append(result)
+            print(f"[OK] {parameters}: {result['widgets']} widgets, "
+                  + ", ".join(f"{name.split('.')[-1]} {timing['median']:.1f}ms" for name, timing in result["timings"].items()),
+                  flush=True)
+    finally:
+        if setOutputDir:
+            del os.environ["TUTORIALMAKER_OUTPUT_DIR"]
+        if args.keep:
+            print(f"[OK] Captures kept in {outputFolder}")
+        else:
+            shutil.rmtree(outputFolder, ignore_errors=True)
+
+    report = {"label": args.label,
+              "revision": module_revision(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "slicer": slicer.app.applicationVersion,
+              "qt": qt.qVersion(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "repeat": args.repeat,
+              "pathSample": args.path_sample,
+              "cases": results}
+    with open(args.output, "w", encoding="utf-8") as fd:
+        json.dump(report, fd, ensure_ascii=False, indent=4)
+    print(f"[OK] {len(results)} cases written to {os.path.abspath(args.output)}")
+    return EXIT_OK
+
+def main(argv):
+    try:
+        args = parse_arguments(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code in (0, None) else EXIT_BENCHMARK_FAILED
+
+    try:
+        return benchmark(args)
+    except Exception:
+        traceback.print_exc()
+        return EXIT_BENCHMARK_FAILED
+
+if __name__ == "__main__":
+    slicer.util.exit(main(sys.argv[1:]))
@@ -0,0 +1,95 @@
+"""Capture one tutorial in one language and resolution, started by Lib/CaptureOrchestrator.py.
+
+    Slicer --no-splash --python-script TutorialMaker/Scripts/capture_worker.py \
+        --tutorial WelcomeTutorial --language fr --resolution 1920x1080 --font-size 14 --result result.json
+
+The captures are written to TUTORIALMAKER_OUTPUT_DIR, set by the orchestrator to a folder of the
+worker. The result file tells the orchestrator how the capture went, Slicer exits with 0 when the
+tutorial was captured and 1 when it failed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+
+import qt
+import slicer
+
+# The module folder, so that Lib can be imported when the module is not loaded
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EXIT_OK = 0
+EXIT_CAPTURE_FAILED = 1
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Capture the screenshots of one tutorial")
+    parser.add_argument("--tutorial", required=True, help="Name of the tutorial in the Testing folder")
+    parser.add_argument("--language", default="en", help="Language of the application during the capture")
+    parser.add_argument("--resolution", default="1920x1080", help="Size of the main window, WIDTHxHEIGHT")
+    parser.add_argument("--font-size", type=int, default=14, help="Point size of the application font")
+    parser.add_argument("--result", required=True, help="JSON file receiving the result of the capture")
+    return parser.parse_args(argv)
+
+def write_result(path, result):
+    with open(path, "w", encoding="utf-8") as fd:
+        json.dump(result, fd, ensure_ascii=False, indent=4)
+
+def count_screenshots(outputPath):
+    rawPath = os.path.join(outputPath, "Raw")
+    count = 0
+    for root, dirs, files in os.walk(rawPath):
+        count += len([file for file in files if file.endswith(".png")])
+    return count
+
+def capture(args):
+    import Lib.TutorialUtils
+    from TutorialMaker import TutorialMakerLogic
+
+    start = time.perf_counter()
+    result = {"tutorial": args.tutorial, "language": args.language, "resolution": args.resolution,
+              "output": Lib.TutorialUtils.get_output_path()}
+
+    def finish(errors=None):
+        error = "\n".join(errors) if errors else None
+        result["elapsed"] = round(time.perf_counter() - start, 3)
+        result["screenshots"] = count_screenshots(result["output"])
+        result["status"] = "failed" if error is not None else "ok"
+        if error is not None:
+            result["error"] = error
+        elif result["screenshots"] == 0:
+            result["status"] = "failed"
+            result["error"] = "No screenshot was captured"
+        write_result(args.result, result)
+        slicer.util.exit(EXIT_OK if result["status"] == "ok" else EXIT_CAPTURE_FAILED)
+
+    try:
+        [width, height] = [int(value) for value in args.resolution.lower().split("x")]
+        slicer.mrmlScene.Clear()
+        Lib.TutorialUtils.Util.verifyOutputFolders()
+        slicer.util.mainWindow().resize(width, height)
+        appFont = slicer.app.font()
+        appFont.setPointSize(args.font_size)
+        slicer.app.setFont(appFont)
+
+        TutorialMakerLogic.installTranslators(args.language)
+        slicer.app.processEvents()
+        slicer.util.mainWindow().update()
+
+        # The steps run from the event loop, finish is called once the last screenshot is written
+        TutorialMakerLogic.runTutorialTestCases(args.tutorial, callback=finish, language=args.language)
+    except Exception:
+        finish([traceback.format_exc()])
+
+def main(argv):
+    try:
+        args = parse_arguments(argv)
+    except SystemExit as e:
+        slicer.util.exit(EXIT_OK if e.code in (0, None) else EXIT_CAPTURE_FAILED)
+        return
+    # Started once the application finished loading the modules
+    qt.QTimer.singleShot(0, lambda: capture(args))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+"""Render annotated tutorials without opening the TutorialMaker GUI.
+
+Run it with the Slicer executable, the arguments after the script are its own:
+
+    Slicer --no-main-window --python-script TutorialMaker/Scripts/render_tutorials.py \
+        --annotations Outputs/Annotations/annotations.json --languages en-US es-419 --output /tmp/tutorials
+
+The screenshots are drawn offscreen on QImages. The captures (Raw/) and the Annotations/ folder are
+read next to the annotations file, from its folder or the one above, so a copied tutorial folder can be
+rendered; the Outputs folder is only the fallback. The text of every language is read from
+Annotations/text_dict_<language>.json (or the default dictionary). Slicer exits with 0 when every
+language was written, 1 when rendering failed and 2 for bad arguments.
+"""
+import os
+import sys
+import time
+import argparse
+import traceback
+
+import slicer
+
+# The module folder, so that Lib can be imported when the module is not loaded
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EXIT_OK = 0
+EXIT_RENDER_FAILED = 1
+EXIT_BAD_ARGUMENTS = 2
+
+def parse_arguments(argv):
+    from Lib.TutorialUtils import get_output_path
+    parser = argparse.ArgumentParser(description="Render annotated tutorials to HTML and Markdown without the GUI")
+    parser.add_argument("--annotations", default=f"{get_output_path()}/Annotations/annotations.json",
+                        help="Annotations file written by the annotator")
+    parser.add_argument("--languages", nargs="+", default=None,
+                        help="Languages to render, separated by spaces or commas (default: the Slicer language)")
+    parser.add_argument("--output", default=None,
+                        help="Folder receiving one <title>_<language> folder per language (default: the Outputs folder)")
+    parser.add_argument("--workers", type=int, default=None, help="Threads drawing and writing the screenshots")
+    parser.add_argument("--embed-images", action="store_true",
+                        help="Embed the screenshots in the HTML as data URIs (default: the TutorialMaker/EmbedImages setting)")
+    parser.add_argument("--image-width", type=int, default=1280, help="Largest width of the embedded screenshots")
+    parser.add_argument("--image-format", default="webp", help="Format of the embedded screenshots: webp, jpeg or png")
+    parser.add_argument("--image-quality", type=int, default=80, help="Quality of the embedded screenshots, 0 to 100")
+    args = parser.parse_args(argv)
+
+    if args.languages is None:
+        args.languages = [slicer.app.userSettings().value("language") or "en-US"]
+    else:
+        args.languages = [language for value in args.languages for language in value.split(",") if language != ""]
+    return args
+
+def input_folder(annotationsPath):
+    """Folder holding the Raw/ captures of the annotations file: its own folder or the one above (Annotations/)"""
+    from Lib.TutorialUtils import get_output_path
+    annotationsFolder = os.path.dirname(os.path.abspath(annotationsPath))
+    for folder in [annotationsFolder, os.path.dirname(annotationsFolder)]:
+        if os.path.isdir(os.path.join(folder, "Raw")):
+            return folder
+    print(f"[WARNING] No Raw folder next to {annotationsPath}, reading the captures from {get_output_path()}")
+    return get_output_path()
+
+def render(args):
+    from Lib.TutorialPainter import TutorialPainter
+
+    if not os.path.exists(args.annotations):
+        print(f"[ERROR] Annotations file not found: {args.annotations}")
+        return EXIT_BAD_ARGUMENTS
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    embedImages = None
+    if args.embed_images:
+        embedImages = {"width": args.image_width, "format": args.image_format, "quality": args.image_quality}
+
+    start = time.perf_counter()
+    outputPaths = TutorialPainter().GenerateLocalizedTutorials(args.annotations,
+                                                               {language: None for language in args.languages},
+                                                               outputFolder=args.output,
+                                                               maxWorkers=args.workers,
+                                                               embedImages=embedImages,
+                                                               inputFolder=input_folder(args.annotations))
+    for language, path in outputPaths.items():
+        print(f"[OK] {language}: {path}")
+    print(f"[OK] Rendered {len(outputPaths)} languages in {time.perf_counter() - start:.1f}s")
+    return EXIT_OK
+
+def main(argv):
+    try:
+        args = parse_arguments(argv)
+    except SystemExit as e:
+        # argparse exits by itself on --help and on bad arguments
+        return EXIT_OK if e.code in (0, None) else EXIT_BAD_ARGUMENTS
+
+    try:
+        return render(args)
+    except Exception:
+        traceback.print_exc()
+        return EXIT_RENDER_FAILED
+
+if __name__ == "__main__":
+    slicer.util.exit(main(sys.argv[1:]))
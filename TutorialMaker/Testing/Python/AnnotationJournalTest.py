@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+# The module folder, so that Lib can be imported without loading the module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Lib.AnnotationJournal import AnnotationJournal
+
+class AnnotationJournalTest(unittest.TestCase):
+    """What the annotator replays after a crash: the header and the operations since the last save"""
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="TutorialMakerTest_")
+        self.path = os.path.join(self.folder, "Annotations", "annotations.journal")
+        # Long interval, the tests write with flush() and close()
+        self.journal = AnnotationJournal(self.path, interval=60)
+        self.header = {"base": "annotations.json", "slides": 3}
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_no_journal(self):
+        self.assertEqual(self.journal.read(), [None, []])
+
+    def test_record_and_read(self):
+        self.journal.start(self.header)
+        self.journal.record("annotation_add", slide=1, index=0, annotation={"type": "Arrow"})
+        self.journal.record("slide_text", slide=1, title="Title", body="")
+        self.journal.close()
+        [header, operations] = self.journal.read()
+        self.assertEqual(header["base"], "annotations.json")
+        self.assertEqual(header["slides"], 3)
+        self.assertEqual([operation["op"] for operation in operations], ["annotation_add", "slide_text"])
+        self.assertEqual(operations[0]["annotation"], {"type": "Arrow"})
+
+    def test_merge(self):
+        operations = [{"op": "annotation_update", "slide": 0, "index": 0, "annotation": 1},
+                      {"op": "annotation_update", "slide": 0, "index": 0, "annotation": 2},
+                      {"op": "annotation_update", "slide": 0, "index": 1, "annotation": 3},
+                      {"op": "slide_text", "slide": 0, "title": "a"},
+                      {"op": "slide_text", "slide": 0, "title": "ab"},
+                      {"op": "annotation_add", "slide": 0, "index": 2, "annotation": 4},
+                      {"op": "annotation_add", "slide": 0, "index": 2, "annotation": 5},
+                      {"op": "step_order", "steps": [[0], [1]]},
+                      {"op": "step_order", "steps": [[1], [0]]}]
+        merged = AnnotationJournal.merge(operations)
+        self.assertEqual(merged, [operations[1], operations[2], operations[4], operations[5], operations[6], operations[8]])
+
+    def test_merge_keeps_interleaved_updates(self):
+        # An update of another annotation in between, both runs must be replayed
+        operations = [{"op": "annotation_update", "slide": 0, "index": 0, "annotation": 1},
+                      {"op": "annotation_update", "slide": 0, "index": 1, "annotation": 2},
+                      {"op": "annotation_update", "slide": 0, "index": 0, "annotation": 3}]
+        self.assertEqual(AnnotationJournal.merge(operations), operations)
+
+    def test_start_drops_saved_operations(self):
+        self.journal.start(self.header)
+        self.journal.record("annotation_add", slide=0, index=0, annotation={})
+        self.journal.flush()
+        # Saving starts a new journal, its edits are in annotations.json
+        self.journal.record("annotation_remove", slide=0, index=0)
+        self.journal.start({"base": "annotations.json", "slides": 4})
+        self.journal.close()
+        [header, operations] = self.journal.read()
+        self.assertEqual(header["slides"], 4)
+        self.assertEqual(operations, [])
+
+    def test_keep_operations(self):
+        self.journal.start(self.header)
+        self.journal.record("annotation_remove", slide=2, index=1)
+        self.journal.close()
+        # Replaying keeps the journal, the edits are still not saved
+        self.journal.start({"base": "annotations.json", "slides": 5}, keepOperations=True)
+        self.journal.record("slide_text", slide=2, title="", body="Body")
+        self.journal.close()
+        [header, operations] = self.journal.read()
+        self.assertEqual(header["slides"], 3)
+        self.assertEqual([operation["op"] for operation in operations], ["annotation_remove", "slide_text"])
+
+    def test_truncated_line(self):
+        self.journal.start(self.header)
+        self.journal.record("annotation_add", slide=0, index=0, annotation={})
+        self.journal.close()
+        # A crash in the middle of a write
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "annotation_remove", "slide": 0, "index": 0})[:20])
+        [header, operations] = self.journal.read()
+        self.assertIsNotNone(header)
+        self.assertEqual(len(operations), 1)
+
+    def test_other_version(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "header", "version": AnnotationJournal.version + 1, "base": "annotations.json"}) + "\n")
+            f.write(json.dumps({"op": "annotation_remove", "slide": 0, "index": 0}) + "\n")
+        self.assertEqual(self.journal.read(), [None, []])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+# The module folder, so that Lib can be imported without loading the module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Lib.WidgetMetadata import CompactWidgetMetadata
+
+class WidgetMetadataTest(unittest.TestCase):
+    """The compact .wmeta files must load back to the dict saved as JSON"""
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="TutorialMakerTest_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @staticmethod
+    def metadata():
+        return {
+            "_devicePixelRatio": 1.25,
+            "0": {"name": "CentralWidget", "path": "qSlicerMainWindow/CentralWidget", "text": "None",
+                  "position": [0.0, 24.5], "size": [1920.0, 1056.0]},
+            "1": {"name": "", "path": "qSlicerMainWindow/CentralWidget/QPushButton:0", "text": "Apply",
+                  "position": [10.0, 30.0], "size": [80.0, 24.0]},
+            "2": {"name": "XlistWidgetItem_0", "path": "qSlicerMainWindow/CentralWidget/List/XlistWidgetItem_0",
+                  "text": "Échantillon 1", "position": [12.25, 64.0], "size": [200.0, 18.0]},
+            "5": {"name": "Toggle", "path": "qSlicerMainWindow/Toggle", "text": True,
+                  "position": [-4.0, 0.0], "size": [0.0, 0.0]}
+        }
+
+    def roundTrip(self, data):
+        path = os.path.join(self.folder, "0" + CompactWidgetMetadata.extension)
+        CompactWidgetMetadata.save(data, path)
+        return CompactWidgetMetadata.load(path)
+
+    def test_round_trip(self):
+        data = self.metadata()
+        self.assertEqual(self.roundTrip(data), data)
+
+    def test_round_trip_integer_keys(self):
+        # getAllWidgetsData uses integer keys, they are strings once the JSON is read back
+        data = self.metadata()
+        widgets = {int(key): value for key, value in data.items() if not key.startswith("_")}
+        widgets["_devicePixelRatio"] = data["_devicePixelRatio"]
+        self.assertEqual(self.roundTrip(widgets), json.loads(json.dumps(widgets)))
+
+    def test_empty(self):
+        self.assertEqual(self.roundTrip({"_devicePixelRatio": 1.0}), {"_devicePixelRatio": 1.0})
+
+    def test_export_json(self):
+        path = os.path.join(self.folder, "0" + CompactWidgetMetadata.extension)
+        CompactWidgetMetadata.save(self.metadata(), path)
+        jsonPath = CompactWidgetMetadata.exportJSON(path)
+        self.assertEqual(jsonPath, os.path.join(self.folder, "0.json"))
+        with open(jsonPath, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), self.metadata())
+
+    def test_not_compact(self):
+        path = os.path.join(self.folder, "0" + CompactWidgetMetadata.extension)
+        with open(path, "wb") as f:
+            f.write(b"{}" * 8)
+        with self.assertRaises(ValueError):
+            CompactWidgetMetadata.load(path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,6 @@ import os
 import platform
 import subprocess
 import slicer
-import importlib
 import qt
 import Lib.TutorialUtils
 import Lib.TutorialPainter as AnnotationPainter
@@ -241,6 +240,10 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
     def ExportScreenshots(self):
         screenshot = Lib.TutorialUtils.ScreenshotTools()
         screenshot.saveScreenshotMetadata(0)
+        try:
+            screenshot.flush()
+        finally:
+            screenshot.shutdown()
         pass
 
     def Capture(self, tutorialName):
@@ -251,8 +254,11 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
         ):
             return  # User cancelled
 
-        def FinishTutorial():
+        def FinishTutorial(errors):
             slicer.util.mainWindow().moduleSelector().selectModule('TutorialMaker')
+            if len(errors) > 0:
+                slicer.util.errorDisplay(_("Failed to capture tutorial, please send this error on our GitHub Issue page:\n{err}").format(err="\n".join(errors)))
+                return
             slicer.util.infoDisplay(_("Tutorial Captured"), _("Captured Tutorial: {tutorialName}").format(tutorialName=tutorialName))
 
         try:
@@ -263,8 +269,8 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
             slicer.util.selectModule("TutorialMaker")
 
     def Generate(self, tutorialName):
-        modulePath = Lib.TutorialUtils.get_module_basepath("TutorialMaker")
-        annotationsPath = modulePath + "/Outputs/Annotations/annotations.json"
+        outputPath = Lib.TutorialUtils.get_output_path()
+        annotationsPath = outputPath + "/Annotations/annotations.json"
         
         if not os.path.exists(annotationsPath):
             slicer.util.warningDisplay(
@@ -276,7 +282,7 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
         
         with slicer.util.tryWithErrorDisplay(_("Failed to generate tutorial")):
             AnnotationPainter.TutorialPainter().GenerateHTMLfromAnnotatedTutorial(annotationsPath)
-            outputPath = modulePath + "/Outputs/"
+            outputPath = outputPath + "/"
             if platform.system() == "Windows":
                     try:
                         import subprocess
@@ -297,9 +303,9 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
         pass
 
     def OpenAnnotator(Self):
-        modulePath = Lib.TutorialUtils.get_module_basepath("TutorialMaker")
-        rawTutorialPath = modulePath + "/Outputs/Raw/Tutorial.json"
-        annotationsPath = modulePath + "/Outputs/Annotations/annotations.json"
+        outputPath = Lib.TutorialUtils.get_output_path()
+        rawTutorialPath = outputPath + "/Raw/Tutorial.json"
+        annotationsPath = outputPath + "/Annotations/annotations.json"
         
         if not os.path.exists(rawTutorialPath):
             slicer.util.warningDisplay(
@@ -362,7 +368,29 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
         return test_tutorials
 
     @staticmethod
-    def runTutorialTestCases(tutorial_name, callback=None):
+    def installTranslators(lang):
+        """Install the translations of the Languages folder for lang, returns them to be removed after the capture"""
+        translators = []
+        if lang == "en":
+            return translators
+        languages_dir = Lib.TutorialUtils.get_module_basepath("TutorialMaker") + "/Languages/"
+        lang_files = [f for f in os.listdir(languages_dir) if (f.endswith(f"_{lang}.qm") or f.endswith(f"-{lang.replace('_', '-')}.qm"))]
+
+        for file in lang_files:
+            qm_path = os.path.join(languages_dir, file)
+            translator = qt.QTranslator()
+            if os.path.exists(qm_path) and translator.load(qm_path):
+                slicer.app.installTranslator(translator)
+                translators.append(translator)
+        return translators
+
+    @staticmethod
+    def removeTranslators(translators):
+        for translator in translators:
+            slicer.app.removeTranslator(translator)
+
+    @staticmethod
+    def runTutorialTestCases(tutorial_name, callback=None, language=None):
         """ Ideally you should have several levels of tests.  At the lowest level
         tests should exercise the functionality of the logic with different inputs
         (both valid and invalid).  At higher levels your tests should emulate the
@@ -374,21 +402,30 @@ class TutorialMakerLogic(ScriptedLoadableModuleLogic): # noqa: F405
         your test should break so they know that the feature is needed.
         """
         tPath = Lib.TutorialUtils.get_module_basepath("TutorialMaker") + f"/Testing/{tutorial_name}.py"
-        SelfTestTutorialLayer.ParseTutorial(tPath)
-        import sys
-        if "Outputs.CurrentParsedTutorial" in sys.modules:
-            del sys.modules["Outputs.CurrentParsedTutorial"]
-        TutorialModule = importlib.import_module("Outputs.CurrentParsedTutorial")
+        TutorialModule = SelfTestTutorialLayer.LoadTutorialModule(tPath)
         for className in TutorialModule.__dict__:
             if("Test" not in className or className == "ScriptedLoadableModuleTest"):
                 continue
             testClass = getattr(TutorialModule, className)
             tutorial = testClass()
-            SelfTestTutorialLayer.RunTutorial(tutorial, callback)
+            SelfTestTutorialLayer.RunTutorial(tutorial, callback, language=language)
             return
         logging.error(_(f"No tests found in {tutorial_name}"))
         raise Exception(_("No Tests Found"))
 
+    @staticmethod
+    def runTutorialTestCasesAndWait(tutorial_name, language=None):
+        """Run the capture of runTutorialTestCases and return once it finished, with its errors"""
+        loop = qt.QEventLoop()
+        result = {}
+        def finished(errors):
+            result["errors"] = errors
+            loop.quit()
+        TutorialMakerLogic.runTutorialTestCases(tutorial_name, callback=finished, language=language)
+        if "errors" not in result:
+            loop.exec_()
+        return result["errors"]
+
 #
 # TutorialMakerTest
 #
@@ -424,22 +461,11 @@ class TutorialMakerTest(ScriptedLoadableModuleTest): # noqa: F405
         error_message = ""
         
         testingFolder = Lib.TutorialUtils.get_module_basepath("TutorialMaker") + "/Testing/"
-        languages_dir = Lib.TutorialUtils.get_module_basepath("TutorialMaker") + "/Languages/"
         
         test_tutorials = [f for f in os.listdir(testingFolder) if f.endswith(".py")]
     
         for lang in languages:
-            translators = []
-            
-            if lang != "en":
-                lang_files = [f for f in os.listdir(languages_dir) if (f.endswith(f"_{lang}.qm") or f.endswith(f"-{lang.replace('_', '-')}.qm"))]
-                
-                for file in lang_files:
-                    qm_path = os.path.join(languages_dir, file)
-                    translator = qt.QTranslator()
-                    if os.path.exists(qm_path) and translator.load(qm_path):
-                        slicer.app.installTranslator(translator)
-                        translators.append(translator)
+            translators = TutorialMakerLogic.installTranslators(lang)
                         
             slicer.app.processEvents()
             slicer.util.mainWindow().update()
@@ -447,8 +473,11 @@ class TutorialMakerTest(ScriptedLoadableModuleTest): # noqa: F405
             for unit_tutorials in test_tutorials:
                 tutorial_name = unit_tutorials.replace(".py", "")
                 try:
-                    # Generate Screenshots and widget metadata
-                    TutorialMakerLogic.runTutorialTestCases(tutorial_name)
+                    # Generate Screenshots and widget metadata. The capture runs from the event loop,
+                    # the translators must stay installed until its last screenshot is taken
+                    errors = TutorialMakerLogic.runTutorialTestCasesAndWait(tutorial_name, language=lang)
+                    if len(errors) > 0:
+                        raise Exception("; ".join(errors))
                     # Paint Screenshots with annotations
                     #AnnotationPainter.ImageDrawer.StartPaint(Lib.TutorialUtils.get_module_basepath("TutorialMaker") + "/Outputs/Annotations/" + unit_tutorials + ".json")
                 except Exception as e:
@@ -457,8 +486,7 @@ class TutorialMakerTest(ScriptedLoadableModuleTest): # noqa: F405
                 finally:
                     self.delayDisplay(_("Tutorial Tested in {lang}").format(lang=lang))
             
-            for translator in translators:
-                slicer.app.removeTranslator(translator)
+            TutorialMakerLogic.removeTranslators(translators)
             
             slicer.app.processEvents()
             slicer.util.mainWindow().update()